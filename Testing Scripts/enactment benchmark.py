@@ -0,0 +1,140 @@
+"""
+Micro-benchmark of the enactment clump evaluation: the old 2-D list of condition rows per clump
+(transposed column by column and OR'd with any()) against h_enactment.EnactmentTracker's one
+bitmask per clump, over synthetic channel histories of thousands of messages.
+
+Checks both find the same enactors first, then times them. Logging is at WARNING, so the old
+way's debug logging only costs the calls themselves.
+
+Run from anywhere: python "Testing Scripts/enactment benchmark.py" [--messages N]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import datetime
+import argparse
+import logging
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #so h_enactment can be imported
+import h_enactment
+
+BOT = None #author of the Bot's own messages
+DAY = datetime.date(2026, 10, 16)
+CONTENTS = [
+    "anyone up for lunch?", "lol", "Stryper Saturday!!!", "rating: 9/10", "this one slaps",
+    "stryper saturday, rating 10/10", "https://youtu.be/dQw4w9WgXcQ", "ok", "RATING 7", "nice",
+]
+
+
+def _makeHistory(num_messages, num_authors=8, seed=1984):
+    """Returns list of (message id, author, content, is_valid_yt), oldest first. Authors post in runs,
+    the Bot now and then"""
+    Random = random.Random(seed)
+    history = []
+    author = None
+    for message_id in range(1, num_messages + 1):
+        if Random.random() < 0.4: #someone else chimes in
+            author = BOT if Random.random() < 0.05 else f"author {Random.randrange(num_authors)}"
+        content = Random.choice(CONTENTS)
+        is_valid_yt = author is not BOT and "youtu" in content and Random.random() < 0.7
+        history.append((message_id, author, content, is_valid_yt))
+    return history
+
+
+def _oldWay(history):
+    """Returns dict of author: number of enacting clumps, the way trigger used to work it out"""
+    clumps = [] #(author, 2-D list of [is_stryper_mentioned, has_rating, is_valid_yt] rows)
+    prev_author = ""
+    clump = None #rows of the current clump, None until a message of it has a condition
+    for _message_id, author, content, is_valid_yt in history:
+        if author != prev_author:
+            clump = None
+        if author is not BOT:
+            is_stryper_mentioned = "stryper saturday" in content.lower()
+            has_rating = "rating" in content.lower()
+            if is_stryper_mentioned or has_rating or is_valid_yt:
+                msg_conditions = [is_stryper_mentioned, has_rating, is_valid_yt]
+                logging.debug("prev_author: %s, msg_conditions: %s", prev_author, msg_conditions)
+                if clump is None:
+                    clump = []
+                    clumps.append((author, clump))
+                clump.append(msg_conditions)
+        prev_author = author
+
+    enactors = {}
+    for author, msg_properties_list in clumps:
+        col_bitwise_or_results = []
+        num_cols = len(msg_properties_list[0])
+        num_rows = len(msg_properties_list)
+        for col in range(num_cols):
+            col_bit_list = []
+            for row in range(num_rows):
+                col_bit_list.append(msg_properties_list[row][col])
+            OR_result = any(col_bit_list)
+            col_bitwise_or_results.append(OR_result)
+            logging.debug("col:%s, col_bit_list: %s, OR_result: %s", col, col_bit_list, OR_result)
+        if all(col_bitwise_or_results):
+            enactors[author] = enactors.get(author, 0) + 1
+    return enactors
+
+
+def _bitmaskWay(history, Tracker):
+    """Returns dict of author: number of enacting clumps, fed through 'Tracker' like on_message does"""
+    for message_id, author, content, is_valid_yt in history:
+        mask = 0 if author is BOT else h_enactment._messageMask(content, is_valid_yt)
+        Tracker.feed(message_id, DAY, author, mask)
+    return Tracker.enactorsOn(DAY)
+
+
+def _newTracker(folder):
+    """Returns h_enactment.EnactmentTracker that won't write during the timing"""
+    Tracker = h_enactment.EnactmentTracker(os.path.join(folder, "enactment.json"), write_delay=3600)
+    Tracker.is_loaded = True
+    return Tracker
+
+
+async def main(args):
+    num_wrong = 0
+    with tempfile.TemporaryDirectory() as folder:
+        for seed in range(20):
+            history = _makeHistory(2_000, seed=seed)
+            Tracker = _newTracker(folder)
+            expected, found = _oldWay(history), _bitmaskWay(history, Tracker)
+            Tracker.persister.discard()
+            if found != expected:
+                num_wrong += 1
+                print(f"WRONG: seed {seed} found {found}, expected {expected}")
+        print(f"{20 - num_wrong}/20 histories give the same enactors")
+
+        print(f"{'messages':>9} {'old median ms':>14} {'bitmask median ms':>18} {'speed up':>9}")
+        for num_messages in args.messages:
+            history = _makeHistory(num_messages)
+            old_times, new_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                _oldWay(history)
+                old_times.append(time.perf_counter() - start)
+
+                Tracker = _newTracker(folder)
+                start = time.perf_counter()
+                _bitmaskWay(history, Tracker)
+                new_times.append(time.perf_counter() - start)
+                Tracker.persister.discard()
+            old, new = statistics.median(old_times), statistics.median(new_times)
+            print(f"{num_messages:>9,} {old * 1e3:>14.2f} {new * 1e3:>18.2f} {old / new:>8.1f}x")
+    return num_wrong
+
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    Parser.add_argument("--messages", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    Parser.add_argument("--repeat", type=int, default=20, help="runs per history size")
+    args = Parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    num_wrong = asyncio.run(main(args)) #the tracker writes behind, which needs an event loop
+    sys.exit(1 if num_wrong else 0)
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark of h_search.SearchIndex over a synthetic library of tens of thousands of songs.
+
+Checks the index against a brute force search first (also after updating and removing songs),
+then times indexing and a mix of queries.
+
+Run from anywhere: python "Testing Scripts/search benchmark.py" [--songs N]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #so h_store can be imported
+import h_store
+import h_search
+
+
+#a few hundred plausible words, then made up ones, picked with Zipf's law like real titles and notes
+WORDS = [
+    "hell", "devil", "soldiers", "under", "command", "rest", "wicked", "free", "honestly", "calling",
+    "heaven", "yellow", "black", "armor", "always", "there", "for", "you", "sing", "along", "song",
+    "live", "remastered", "acoustic", "demo", "version", "legendary", "classic", "ballad", "solo",
+    "michael", "sweet", "oz", "fox", "robert", "tim", "gaines", "guitar", "drums", "anthem",
+] + [f"{consonant}{vowel}{ending}" for consonant in "bcdfghjklmnprstvwz" for vowel in "aeiou" for ending in
+     ("n", "rt", "ld", "ck", "ss", "mp", "ng", "sh", "ve", "ze", "ly", "rk")]
+ZIPF_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+QUERIES = [
+    "hell", "devil", "soldiers command", "sw*", "live rating>=8", "legendary ballad", "rating<3",
+    "heaven* rating>5", "gaines drums solo", "zzz", "be*", "bart rating=5",
+]
+
+
+def _makeSongs(num_songs, seed=1984):
+    """Returns list of h_store.Song with made up titles, notes and ratings"""
+    Random = random.Random(seed)
+    songs = []
+    for i in range(num_songs):
+        title = " ".join(Random.choices(WORDS, ZIPF_WEIGHTS, k=Random.randint(1, 5))) + f" {i}"
+        notes = " ".join(Random.choices(WORDS, ZIPF_WEIGHTS, k=Random.randint(0, 8)))
+        rating = round(Random.uniform(0, 10), 1)
+        songs.append(h_store.Song(title, f"https://youtu.be/{i:011d}", int(rating) if rating.is_integer() else rating, notes))
+    return songs
+
+
+def _bruteForce(songs_by_key, text):
+    """Returns set of the keys matching 'text' by scanning every song"""
+    Query = h_search.SearchQuery(text)
+    matches = set()
+    for key, song in songs_by_key.items():
+        tokens = set(h_search._tokenize(song.title + " " + song.notes))
+        is_match = (Query.ratingMatches(song.rating) and all(term in tokens for term in Query.terms)
+                    and all(any(token.startswith(prefix) for token in tokens) for prefix in Query.prefixes))
+        if is_match:
+            matches.add(key)
+    return matches
+
+
+def _checkAgainstBruteForce(songs):
+    """Returns the number of queries the index gets wrong, printing them"""
+    Index = h_search.SearchIndex()
+    songs_by_key = {}
+    for song in songs:
+        Index.add(song.url, song)
+        songs_by_key[song.url] = song
+    for song in songs[::3]: #update a third, remove a third
+        updated = h_store.Song(song.title, song.url, 10 - song.rating, "updated " + song.notes)
+        Index.update(song.url, updated)
+        songs_by_key[song.url] = updated
+    for song in songs[1::3]:
+        Index.remove(song.url)
+        del songs_by_key[song.url]
+
+    num_wrong = 0
+    for text in QUERIES:
+        found, num_matches = Index.search(text, limit=len(songs))
+        expected = _bruteForce(songs_by_key, text)
+        if set(found) != expected or num_matches != len(expected):
+            num_wrong += 1
+            print(f"WRONG: {text!r} found {num_matches}, expected {len(expected)}")
+    print(f"{len(QUERIES) - num_wrong}/{len(QUERIES)} queries match brute force")
+    return num_wrong
+
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    Parser.add_argument("--songs", type=int, default=50_000)
+    Parser.add_argument("--repeat", type=int, default=200, help="runs per query")
+    args = Parser.parse_args()
+
+    num_wrong = _checkAgainstBruteForce(_makeSongs(3_000))
+
+    songs = _makeSongs(args.songs)
+    start = time.perf_counter()
+    Index = h_search.SearchIndex()
+    Index.addMany((song.url, song) for song in songs)
+    print(f"indexed {args.songs:,} songs in {time.perf_counter() - start:.2f} s")
+
+    print(f"{'query':<22} {'matches':>8} {'median us':>10} {'max us':>10}")
+    for text in QUERIES:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _found, num_matches = Index.search(text)
+            times.append(time.perf_counter() - start)
+        print(f"{text:<22} {num_matches:>8,} {statistics.median(times) * 1e6:>10.1f} {max(times) * 1e6:>10.1f}")
+
+    sys.exit(1 if num_wrong else 0)
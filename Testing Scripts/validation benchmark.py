@@ -0,0 +1,160 @@
+"""
+Offline benchmark of youtube url validation, so slowdowns show up before deploying.
+
+Serves the watch pages in 'fixtures/' from a local stand-in http server and times fetching
+(per h_functions.FETCHERS mode), parsing (per h_functions.EXTRACTORS engine), and both together.
+The results are checked against what each page should give, so a fast but wrong engine is obvious.
+
+The fixtures are made from the tags captured in 'youtube scraping tests.py'. The bulky parts of
+a real watch page (inline scripts, skeleton divs) are stood in for by '<!-- PADDING:n -->'
+markers, expanded to n KB of similar filler when the server starts, to keep the repo small.
+
+Run from anywhere: python "Testing Scripts/validation benchmark.py" [--repeat N]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import threading
+import re
+import http.server
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_FOLDER)) #so h_functions can be imported
+import h_functions
+
+
+FIXTURE_FOLDER = os.path.join(SCRIPT_FOLDER, "fixtures")
+PADDING_REGEX = re.compile(r"<!-- PADDING:(\d+) -->")
+SERVE_CHUNK_BYTES = 8 * 1024
+
+#fixture name: what _parseYoutubePage() should return for it
+EXPECTED = {
+    "stryper": (True, "To Hell with the Devil"),
+    "other_channel": (False, "Free (Live)"),
+    "missing_title": (False, ""),
+    "huge": (True, "To Hell with the Devil"),
+}
+
+
+def _filler(kilobytes):
+    """Returns str of about 'kilobytes' KB of watch page-ish markup"""
+    block = (
+        '<div class="style-scope ytd-rich-item-renderer" id="dismissible"><a class="yt-simple-endpoint" '
+        'href="/watch?v=EhRJiiF11vo"><svg viewBox="0 0 24 24"><path d="M21.58 7.19c-.23-.86-.91-1.54-1.77-1.77'
+        'C18.25 5 12 5 12 5s-6.25 0-7.81.42c-.86.23-1.54.91-1.77 1.77"></path></svg></a></div>'
+        '<script nonce="IrvoVklBlQOW5t6z7RMPLw">var ytInitialData = {"responseContext":{"serviceTrackingParams":'
+        '[{"service":"GFEEDBACK","params":[{"key":"logged_in","value":"0"}]}],"mainAppWebResponseContext":'
+        '{"loggedOut":true},"webResponseContextExtensionData":{"hasDecorated":true}}};</script>'
+    )
+    repeats = (kilobytes * 1024) // len(block) + 1
+    return block * repeats #whole blocks only, a cut off <script> would swallow the tags after it
+
+
+def _loadFixtures():
+    """Returns dict of fixture name: page bytes, with the padding markers expanded"""
+    fixtures = {}
+    for file_name in sorted(os.listdir(FIXTURE_FOLDER)):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".html":
+            with open(os.path.join(FIXTURE_FOLDER, file_name), "r", encoding="utf-8") as read_file:
+                raw = read_file.read()
+            page = PADDING_REGEX.sub(lambda match: _filler(int(match.group(1))), raw)
+            fixtures[name] = page.encode("utf-8")
+    return fixtures
+
+
+def _startServer(fixtures):
+    """Returns (ThreadingHTTPServer, str) of the running stand-in server and its base url.
+    '/watch?v=<fixture name>' serves that fixture in chunks, like youtube does"""
+
+    class FixtureHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" #keep-alive, same as the real thing
+
+        def do_GET(self):
+            name = self.path.partition("v=")[2]
+            page = fixtures.get(name)
+            if page is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            try:
+                for i in range(0, len(page), SERVE_CHUNK_BYTES):
+                    self.wfile.write(page[i:i + SERVE_CHUNK_BYTES])
+            except (BrokenPipeError, ConnectionResetError):
+                pass #streaming fetches hang up early on purpose
+
+        def log_message(self, *args):
+            pass #quiet
+
+    class FixtureServer(http.server.ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    Server = FixtureServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=Server.serve_forever, daemon=True).start()
+    host, port = Server.server_address
+    return Server, f"http://{host}:{port}/watch?v="
+
+
+def _ms(seconds_list):
+    """Returns str of the median and max of 'seconds_list' in milliseconds"""
+    return f"{statistics.median(seconds_list) * 1000:8.2f} {max(seconds_list) * 1000:8.2f}"
+
+
+async def benchmark(base_url, fixtures, repeat, modes, engines):
+    """Prints a table of fetch, parse and total times, returns the number of wrong results"""
+    num_wrong = 0
+    print(f"{'fixture':<14} {'mode':<7} {'engine':<9} {'bytes':>9}   {'fetch ms (med max)':>17}   "
+          f"{'parse ms (med max)':>17}   {'total ms (med max)':>17}  result")
+
+    for name in fixtures:
+        for mode in modes:
+            for engine in engines:
+                fetch_times, parse_times, total_times = [], [], []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    _status, content = await h_functions._fetch(base_url + name, mode)
+                    fetched = time.perf_counter()
+                    result = h_functions._parseYoutubePage(content, name, engine)
+                    parsed = time.perf_counter()
+
+                    fetch_times.append(fetched - start)
+                    parse_times.append(parsed - fetched)
+                    total_times.append(parsed - start)
+
+                is_right = result == EXPECTED.get(name, result)
+                num_wrong += not is_right
+                print(f"{name:<14} {mode:<7} {engine:<9} {len(content):>9}   {_ms(fetch_times)}   "
+                      f"{_ms(parse_times)}   {_ms(total_times)}  {'ok' if is_right else 'WRONG ' + str(result)}")
+    return num_wrong
+
+
+async def main(args):
+    fixtures = _loadFixtures()
+    Server, base_url = _startServer(fixtures)
+    try:
+        num_wrong = await benchmark(base_url, fixtures, args.repeat, args.modes, args.engines)
+    finally:
+        await h_functions._closeSession()
+        Server.shutdown()
+
+    if num_wrong:
+        print(f"\n{num_wrong} wrong results!")
+    return num_wrong
+
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    Parser.add_argument("--repeat", type=int, default=20, help="runs per fixture/mode/engine")
+    Parser.add_argument("--modes", nargs="+", default=list(h_functions.FETCHERS), choices=list(h_functions.FETCHERS))
+    Parser.add_argument("--engines", nargs="+", default=list(h_functions.EXTRACTORS), choices=list(h_functions.EXTRACTORS))
+    sys.exit(1 if asyncio.run(main(Parser.parse_args())) else 0)
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of h_functions._findVideoIDs() over lots of synthetic Discord messages,
+next to the old fixed 11 character slice after 'https://www.youtube.com/watch?v=' that trigger used.
+
+Checks a list of known link forms first, then times both over the same messages.
+
+Run from anywhere: python "Testing Scripts/video id parser benchmark.py" [--messages N]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #so h_functions can be imported
+import h_functions
+
+
+#text: the IDs _findVideoIDs() should give
+KNOWN_CASES = {
+    "https://www.youtube.com/watch?v=sG0zAn0dL2I": ["sG0zAn0dL2I"],
+    "<https://www.youtube.com/watch?v=sG0zAn0dL2I>": ["sG0zAn0dL2I"],
+    "https://www.youtube.com/watch?v=EhRJiiF11vo&list=OLAK5uy_lWsF2gOUCoNvFjzAUXGKE-Ldr6byjkEhI&index=58": ["EhRJiiF11vo"],
+    "http://youtube.com/watch?feature=share&v=ev2HCjTLpLU": ["ev2HCjTLpLU"],
+    "https://youtu.be/GvIS9029wzw?si=abc": ["GvIS9029wzw"],
+    "https://m.youtube.com/watch?v=GvIS9029wzw": ["GvIS9029wzw"],
+    "https://music.youtube.com/watch?v=GvIS9029wzw&feature=share": ["GvIS9029wzw"],
+    "https://www.youtube.com/shorts/ev2HCjTLpLU": ["ev2HCjTLpLU"],
+    "https://www.youtube.com/embed/ev2HCjTLpLU?start=5": ["ev2HCjTLpLU"],
+    "youtube.com/watch?v=sG0zAn0dL2I and youtu.be/EhRJiiF11vo, youtu.be/sG0zAn0dL2I again": ["sG0zAn0dL2I", "EhRJiiF11vo"],
+    "Stryper Saturday! rating 10/10 https://www.youtube.com/watch?v=sG0zAn0dL2I!!!": ["sG0zAn0dL2I"],
+    "https://www.youtube.com/channel/UC20qdRIIoh4Xr6jnmZ4HBng": [],
+    "https://www.youtube.com/watch?v=tooshort": [],
+    "https://www.youtube.com/watch?v=waytoolongvideoid": [],
+    "https://notyoutube.com/watch?v=sG0zAn0dL2I": [],
+    "no links here, just stryper saturday talk": [],
+}
+
+CHAT = [
+    "anyone up for some stryper saturday?", "rating this one a solid 8", "lol", "good morning all",
+    "To Hell with the Devil is the best album, fight me", "did you see the game last night",
+    "brb making coffee", "I think Michael Sweet hit that note in the live version too",
+]
+LINK_FORMS = [
+    "https://www.youtube.com/watch?v={id}", "<https://www.youtube.com/watch?v={id}>",
+    "https://www.youtube.com/watch?v={id}&list=OLAK5uy_lWsF2gOUCoNvFjzAUXGKE&index=58",
+    "https://youtu.be/{id}?si=Xk3abc", "https://m.youtube.com/watch?v={id}",
+    "https://music.youtube.com/watch?v={id}&feature=share", "https://www.youtube.com/shorts/{id}",
+    "http://youtube.com/watch?feature=share&v={id}",
+]
+ID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
+
+
+def _makeMessages(num_messages, seed=1986):
+    """Returns list of str, roughly 80% chat, 15% one link, 5% a few links"""
+    Random = random.Random(seed)
+    messages = []
+    for _ in range(num_messages):
+        text = Random.choice(CHAT)
+        roll = Random.random()
+        num_links = 0 if roll < 0.8 else (1 if roll < 0.95 else Random.randint(2, 4))
+        for _ in range(num_links):
+            video_id = "".join(Random.choice(ID_CHARS) for _ in range(11))
+            text += " " + Random.choice(LINK_FORMS).format(id=video_id)
+        messages.append(text)
+    return messages
+
+
+def _oldSlice(text):
+    """Returns list with the ID the old trigger code would have sliced out of 'text', if any"""
+    key_str = "https://www.youtube.com/watch?v="
+    start = text.find(key_str)
+    if start == -1:
+        return []
+    start += len(key_str)
+    return [text[start:start + 11]]
+
+
+def _checkKnownCases():
+    """Returns the number of known cases _findVideoIDs() gets wrong, printing them"""
+    num_wrong = 0
+    for text, expected in KNOWN_CASES.items():
+        found = h_functions._findVideoIDs(text)
+        if found != expected:
+            num_wrong += 1
+            print(f"WRONG: {text!r} gave {found}, expected {expected}")
+    print(f"{len(KNOWN_CASES) - num_wrong}/{len(KNOWN_CASES)} known cases right")
+    return num_wrong
+
+
+def _time(parser, messages):
+    """Returns (float, int) of seconds taken and IDs found by 'parser' over 'messages'"""
+    start = time.perf_counter()
+    num_found = 0
+    for text in messages:
+        num_found += len(parser(text))
+    return time.perf_counter() - start, num_found
+
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    Parser.add_argument("--messages", type=int, default=2_000_000)
+    args = Parser.parse_args()
+
+    num_wrong = _checkKnownCases()
+
+    print(f"making {args.messages:,} messages...")
+    messages = _makeMessages(args.messages)
+    for name, parser in [("_findVideoIDs", h_functions._findVideoIDs), ("old slice", _oldSlice)]:
+        seconds, num_found = _time(parser, messages)
+        print(f"{name:<14} {seconds:7.3f} s  {args.messages / seconds / 1e6:6.2f} M msgs/s  "
+              f"{seconds / args.messages * 1e9:7.1f} ns/msg  {num_found:,} IDs found")
+
+    sys.exit(1 if num_wrong else 0)
@@ -0,0 +1,126 @@
+"""
+Keeping track of who has enacted Stryper Saturday today, message by message as they are posted,
+so the trigger doesn't have to go back through the day's messages when it is time to post
+"""
+import os
+import logging
+import datetime
+
+import h_persist
+
+Logger = logging.getLogger( __name__)
+
+STRYPER_PHRASE = "stryper saturday"
+RATING_WORD = "rating"
+
+#condition bits of a message or clump, a clump has enacted once its mask is ALL
+STRYPER_MENTIONED = 1
+HAS_RATING = 2
+VALID_YT = 4
+ALL = STRYPER_MENTIONED | HAS_RATING | VALID_YT
+
+
+def _messageMask(content, is_valid_yt):
+    """Returns int, the condition bits of a message with 'content' (str). 'is_valid_yt' (bool) is
+    whether any of its youtube links is an official Stryper video"""
+    lowered = content.lower()
+    mask = VALID_YT if is_valid_yt else 0
+    if STRYPER_PHRASE in lowered:
+        mask |= STRYPER_MENTIONED
+    if RATING_WORD in lowered:
+        mask |= HAS_RATING
+    return mask
+
+
+
+class EnactmentTracker:
+    """Today's enactments, fed every message of the channel in order with feed(). Messages in a row by
+    the same author make a 'clump' (any other author, the Bot included, ends it), and an author has
+    enacted once a clump of theirs has mentioned Stryper Saturday, given a rating and linked an official
+    Stryper video, in any of its messages. Only the current clump and who has enacted are kept, so
+    deciding at trigger time is O(1). Kept at 'path', written behind like the data file"""
+
+    def __init__(self, path, indent=4, write_delay=h_persist.WRITE_BEHIND_DELAY):
+        self.path = path
+        self.date = None #str, isoformat of the day the state is for, it starts over each day
+        self._day = None #datetime.date of 'date', so feed() compares dates rather than making str's
+        self.last_id = 0 #int, id of the last message fed, so catching up twice doesn't count one twice
+        self.clump_author = None #str, id of the author of the current clump, None for the Bot or no clump
+        self.clump_mask = 0 #int, condition bits OR'd over the current clump
+        self.enactors = {} #author id (str): number of their clumps enacting today
+        self.is_loaded = False
+        self.persister = h_persist.JsonPersister(path, self.toDict, indent=indent, delay=write_delay)
+
+
+    def toDict(self):
+        return {"date": self.date, "last_id": self.last_id, "clump_author": self.clump_author,
+                "clump_mask": self.clump_mask, "enactors": dict(self.enactors)}
+
+
+    def _apply(self, state):
+        self.date = state.get("date")
+        self._day = datetime.date.fromisoformat(self.date) if self.date else None
+        self.last_id = state.get("last_id", 0)
+        self.clump_author = state.get("clump_author")
+        self.clump_mask = state.get("clump_mask", 0) & ALL
+        self.enactors = dict(state.get("enactors", {}))
+        self.is_loaded = True
+
+
+    def _read(self):
+        """Returns dict of the saved state, empty if there is none (or it's unreadable). Blocking"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            return self.persister.load()
+        except (OSError, ValueError) as e:
+            Logger.warning("Couldn't read '%s' (%r), starting from scratch", self.path, e)
+            return {}
+
+
+    async def loadAsync(self):
+        """Loads the saved state, reading it on the persister's I/O thread"""
+        self._apply(await self.persister.run(self._read))
+
+
+    def isCurrent(self, date):
+        """Returns bool, whether the state is for 'date' (datetime.date)"""
+        return self.date == date.isoformat()
+
+
+    def feed(self, message_id, date, author_id, mask):
+        """Takes in the message of 'message_id' (int), posted on 'date' (datetime.date) by 'author_id'
+        (str, None for the Bot) with 'mask' (int from _messageMask()). Messages have to come
+        oldest first, already fed ones are skipped. Returns bool, whether it was new"""
+        if message_id <= self.last_id:
+            return False
+        if date != self._day:
+            if self._day is not None and date < self._day:
+                return False #from before the current day, too late to count
+            self.date = date.isoformat()
+            self._day = date
+            Logger.info("Starting enactments of %s", self.date)
+            self.clump_author = None
+            self.enactors = {}
+        self.last_id = message_id
+
+        if author_id != self.clump_author:
+            self.clump_author = author_id
+            self.clump_mask = 0
+        if author_id is not None and self.clump_mask != ALL:
+            self.clump_mask |= mask
+            if self.clump_mask == ALL:
+                Logger.info("%s has enacted Stryper Saturday", author_id)
+                self.enactors[author_id] = self.enactors.get(author_id, 0) + 1
+        self.persister.touch()
+        return True
+
+
+    def enactorsOn(self, date):
+        """Returns dict of author id (str): number of enacting clumps on 'date' (datetime.date)"""
+        return self.enactors if date == self._day else {}
+
+
+    async def closeAsync(self):
+        """Writes the state if it changed and closes the persister, on shutdown"""
+        await self.persister.closeAsync()
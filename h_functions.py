@@ -3,13 +3,77 @@ Neater way to store helper functions
 
 Created: Noah Lobbe, 8 December 2023
 """
+import asyncio
+import collections
+import concurrent.futures
+import html
 import logging
-import requests
-from bs4 import BeautifulSoup
-import validators
+import random
+import re
+import sqlite3
+import time
+import aiohttp
+from bs4 import BeautifulSoup, SoupStrainer
 
 Logger = logging.getLogger( __name__)
 
+YT_VIDEO_KEY_STR = "https://www.youtube.com/watch?v=" #canonical form of a video url, plus the ID
+#any video link: youtube.com/watch (v= anywhere in the query), youtu.be, m./music. youtube, shorts, embed, live.
+#Group 1 is the 11 character video ID
+YT_VIDEO_ID_REGEX = re.compile(
+    r"(?:https?://|(?<![\w.-]))(?:(?:www|m|music)\.)?"
+    r"(?:youtube\.com/(?:watch/?\?(?:[^\s<>#]*?&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)"
+    r"([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])"
+    )
+STRYPER_CHANNEL_URL = "http://www.youtube.com/channel/UC20qdRIIoh4Xr6jnmZ4HBng"
+
+#shared http session settings, one session is kept for the life of the Bot so connections get reused
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5, sock_read=10) #seconds
+HTTP_POOL_LIMIT = 16 #max open connections overall
+HTTP_POOL_LIMIT_PER_HOST = 8
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_DNS_CACHE_SECONDS = 300
+
+Session = None #aiohttp.ClientSession, made by _openSession()
+
+#how watch pages are downloaded, "stream" stops reading once the title and channel are found, "full" reads the lot
+FETCH_MODE = "stream"
+STREAM_CHUNK_BYTES = 16 * 1024
+STREAM_MAX_BYTES = 1024 * 1024 #hard cap, pages are a few hundred KB
+
+#how the title and channel are pulled out of a watch page, see EXTRACTORS. 
+#The fallback is used whenever another engine can't find a title
+EXTRACTOR_ENGINE = "regex"
+EXTRACTOR_FALLBACK = "soup"
+
+#precompiled patterns for the tags holding the video's title and channel
+TITLE_META_REGEX = re.compile(rb'<meta\b[^>]*\bname="title"[^>]*>')
+URL_LINK_REGEX = re.compile(rb'<link\b[^>]*\bitemprop="url"[^>]*>')
+TAG_ATTR_REGEX = re.compile(rb'([\w:-]+)\s*=\s*"([^"]*)"')
+
+#batch validation settings, see _validateMany()
+VALIDATE_MAX_CONCURRENCY = 8 #no point going past HTTP_POOL_LIMIT_PER_HOST
+VALIDATE_TIMEOUT = 20 #seconds, per url
+
+#circuit breaker settings for youtube fetches, see CircuitBreaker
+BREAKER_WINDOW = 20 #most recent fetches the failure rate is worked out from
+BREAKER_MIN_CALLS = 5 #the breaker won't open on fewer fetches than this
+BREAKER_FAILURE_RATE = 0.5 #opens when at least this fraction of the window failed
+BREAKER_BASE_DELAY = 30 #seconds open the first time, doubled every time the probe fails too
+BREAKER_MAX_DELAY = 30 * 60 #seconds
+BREAKER_JITTER = 0.2 #+- fraction of the delay, so retries don't all line up
+
+#cache prewarm settings, see _prewarmCache()
+PREWARM_MAX_CONCURRENCY = 2 #low priority, leaves the rest of the pool for commands
+PREWARM_INTERVAL = 1.0 #seconds between starting fetches
+PREWARM_LOG_EVERY = 25 #videos
+
+#video metadata cache settings
+CACHE_FILE = "yt_cache.db" #None for a memory only cache
+CACHE_MAX_ENTRIES = 1024 #in memory, the file keeps everything
+CACHE_POSITIVE_TTL = 30 * 24 * 60 * 60 #seconds, official Stryper videos don't change channel
+CACHE_NEGATIVE_TTL = 6 * 60 * 60 #seconds, other channels/missing titles are re-checked sooner
+
 
 ### Miscellaneous helper functions
 def _getDictKey(Dict, value):
@@ -38,86 +102,761 @@ def _str2DList(List):
 
 
 
+### YouTube video metadata cache
+VideoMeta = collections.namedtuple("VideoMeta", ["is_stryper_channel", "title", "fetched_at"])
+
+
+class VideoCache:
+    """Cache of youtube video metadata (VideoMeta) keyed by video ID. A LRU dict in memory 
+    is checked first, then a sqlite file which survives restarts. Entries for official Stryper 
+    videos live for 'positive_ttl' seconds and anything else for 'negative_ttl' seconds. 
+    Inside the event loop the file is only read and written on the cache's own I/O thread 
+    (getAsync(), put()), the memory tier stays on the loop"""
+
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES, 
+                 positive_ttl=CACHE_POSITIVE_TTL, negative_ttl=CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+        self.hits = 0
+        self.disk_hits = 0 #also counted in hits
+        self.misses = 0
+        self.expired = 0 #also counted in misses
+
+        self._memory = collections.OrderedDict() #oldest used first
+        self._db = None #sqlite3.Connection, made on first use by _connect()
+        self._Executor = None #the I/O thread of the disk tier, a single worker concurrent.futures.ThreadPoolExecutor
+
+
+    def _executor(self):
+        if self._Executor is None:
+            self._Executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="h_functions cache")
+        return self._Executor
+
+
+    async def _run(self, func, *args):
+        """Returns the result of 'func'(*args) run on the I/O thread, after anything already queued on it"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), func, *args)
+
+
+    def _connect(self):
+        """Returns the sqlite3.Connection of the disk tier, or None if there isn't one"""
+        if self._db is None and self.path is not None:
+            try:
+                self._db = sqlite3.connect(self.path, check_same_thread=False) #never used by two threads at once
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL") #it is only a cache, losing the last few entries is fine
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS video_meta ("
+                    "video_id TEXT PRIMARY KEY, is_stryper_channel INTEGER NOT NULL, "
+                    "title TEXT NOT NULL, fetched_at REAL NOT NULL)"
+                    )
+                self._db.commit()
+                Logger.info("Opened video cache file '%s'", self.path)
+            except sqlite3.Error as e:
+                Logger.debug("Couldn't open video cache file '%s', memory only: %s", self.path, e)
+                self._db = None
+                self.path = None
+        return self._db
+
+
+    def _isFresh(self, meta, now):
+        """Returns bool"""
+        ttl = self.positive_ttl if meta.is_stryper_channel else self.negative_ttl
+        return (now - meta.fetched_at) < ttl
+
+
+    def _remember(self, video_id, meta):
+        """Puts 'meta' into the memory tier, evicting the least recently used if full"""
+        self._memory[video_id] = meta
+        self._memory.move_to_end(video_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+    def get(self, video_id, now=None, count=True):
+        """Returns a fresh VideoMeta for 'video_id' (str), or None if not cached or expired. 
+        'count' False leaves the hit/miss counters alone, for lookups that aren't real validations. 
+        Blocking on a memory miss, inside the event loop use getAsync()"""
+        meta = self._memory.get(video_id)
+        is_from_disk = meta is None
+        if is_from_disk:
+            meta = self._load(video_id)
+        return self._check(video_id, meta, is_from_disk, now, count)
+
+
+    async def getAsync(self, video_id, now=None, count=True):
+        """get() with the file read on the I/O thread"""
+        meta = self._memory.get(video_id)
+        is_from_disk = meta is None
+        if is_from_disk and self.path is not None:
+            meta = await self._run(self._load, video_id)
+        return self._check(video_id, meta, is_from_disk, now, count)
+
+
+    async def getManyAsync(self, video_ids, now=None, count=False):
+        """Returns dict of video ID: fresh VideoMeta of those of 'video_ids' (list of str) that are cached. 
+        The ones not in memory are read from the file in one go, on the I/O thread"""
+        on_disk = {}
+        not_in_memory = [video_id for video_id in video_ids if video_id not in self._memory]
+        if not_in_memory and self.path is not None:
+            on_disk = await self._run(self._loadMany, not_in_memory)
+
+        in_memory = {video_id: self._memory[video_id] for video_id in video_ids if video_id in self._memory} #before _check() evicts any
+        found = {}
+        for video_id in video_ids:
+            is_from_disk = video_id not in in_memory
+            meta = on_disk.get(video_id) if is_from_disk else in_memory[video_id]
+            meta = self._check(video_id, meta, is_from_disk, now, count)
+            if meta is not None:
+                found[video_id] = meta
+        return found
+
+
+    def _check(self, video_id, meta, is_from_disk, now, count):
+        """Returns 'meta' (VideoMeta or None) of 'video_id' if it is fresh, else None, counting it"""
+        if now is None:
+            now = time.time()
+        if meta is not None:
+            if self._isFresh(meta, now):
+                if count:
+                    self.hits += 1
+                    self.disk_hits += is_from_disk
+                self._remember(video_id, meta)
+                return meta
+            self.expired += count
+            self._memory.pop(video_id, None)
+
+        self.misses += count
+        return None
+
+
+    def _load(self, video_id):
+        """Returns the VideoMeta of 'video_id' from the disk tier, or None"""
+        db = self._connect()
+        if db is not None:
+            try:
+                row = db.execute(
+                    "SELECT is_stryper_channel, title, fetched_at FROM video_meta WHERE video_id = ?", 
+                    (video_id,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                Logger.debug("video cache read failed for %s: %s", video_id, e)
+                return None
+            if row is not None:
+                return VideoMeta(bool(row[0]), row[1], row[2])
+        return None
+
+
+    def _loadMany(self, video_ids, chunk_size=500):
+        """Returns dict of video ID: VideoMeta of those of 'video_ids' in the disk tier"""
+        found = {}
+        db = self._connect()
+        if db is None:
+            return found
+        for i in range(0, len(video_ids), chunk_size): #sqlite has a limit on parameters per statement
+            chunk = video_ids[i:i + chunk_size]
+            try:
+                rows = db.execute(
+                    "SELECT video_id, is_stryper_channel, title, fetched_at FROM video_meta WHERE video_id IN "
+                    "(" + ", ".join("?" * len(chunk)) + ")", chunk
+                    ).fetchall()
+            except sqlite3.Error as e:
+                Logger.debug("video cache read failed for %s videos: %s", len(chunk), e)
+                continue
+            for video_id, is_stryper_channel, title, fetched_at in rows:
+                found[video_id] = VideoMeta(bool(is_stryper_channel), title, fetched_at)
+        return found
+
+
+    def put(self, video_id, is_stryper_channel, title, fetched_at=None):
+        """Caches the metadata of 'video_id' (str) in both tiers, returns the VideoMeta. The file 
+        is written on the I/O thread if there is an event loop, in the background"""
+        if fetched_at is None:
+            fetched_at = time.time()
+        meta = VideoMeta(bool(is_stryper_channel), title, fetched_at)
+        self._remember(video_id, meta)
+        if self.path is None:
+            return meta
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._store(video_id, meta)
+        else:
+            self._executor().submit(self._store, video_id, meta) #errors are logged by _store()
+        return meta
+
+
+    def _store(self, video_id, meta):
+        """Writes 'meta' of 'video_id' to the disk tier"""
+        db = self._connect()
+        if db is not None:
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO video_meta (video_id, is_stryper_channel, title, fetched_at) VALUES (?, ?, ?, ?)",
+                    (video_id, int(meta.is_stryper_channel), meta.title, meta.fetched_at)
+                    )
+                db.commit()
+            except sqlite3.Error as e:
+                Logger.debug("video cache write failed for %s: %s", video_id, e)
+
+
+    def stats(self):
+        """Returns dict of the hit/miss counters"""
+        return {
+            "hits": self.hits, 
+            "disk_hits": self.disk_hits, 
+            "misses": self.misses, 
+            "expired": self.expired, 
+            "in_memory": len(self._memory)
+            }
+
+
+    def _closeDb(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+    def close(self):
+        """Finishes any writes and closes the disk tier, it gets reopened if the cache is used again. 
+        Blocking, inside the event loop use closeAsync()"""
+        if self._Executor is not None:
+            self._Executor.submit(self._closeDb).result() #after the writes queued before it
+            self._Executor.shutdown()
+            self._Executor = None
+        self._closeDb()
+        Logger.info("Video cache stats: %s", self.stats())
+
+
+    async def closeAsync(self):
+        """close() without blocking the event loop"""
+        if self._Executor is not None:
+            await self._run(self._closeDb)
+            self._Executor.shutdown()
+            self._Executor = None
+        self._closeDb()
+        Logger.info("Video cache stats: %s", self.stats())
+
+
+MetaCache = VideoCache()
+
+
+class SingleFlight:
+    """Makes concurrent calls for the same key share one in flight call. 
+    Everyone waiting on the key gets its result (or exception)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.saved = 0 #requests that joined a call already in flight, instead of making their own
+        self._in_flight = {} #key: asyncio.Task
+
+
+    async def do(self, key, async_func, *args):
+        """Returns the result of 'async_func(*args)', sharing the call with anyone else 
+        already waiting on 'key'"""
+        self.requests += 1
+        Task = self._in_flight.get(key)
+        if Task is None:
+            Task = asyncio.ensure_future(async_func(*args))
+            self._in_flight[key] = Task
+            Task.add_done_callback(lambda Done: self._forget(key, Done))
+        else:
+            self.saved += 1
+            Logger.debug("Joining call in flight for %s", key)
+        #shield so one caller being cancelled doesn't cancel the call for everyone else
+        return await asyncio.shield(Task)
+
+
+    def _forget(self, key, Task):
+        """Removes the finished 'Task' of 'key' from the calls in flight"""
+        if self._in_flight.get(key) is Task:
+            del self._in_flight[key]
+        if not Task.cancelled():
+            Task.exception() #marks it as retrieved, in case every caller gave up waiting
+
+
+    def stats(self):
+        """Returns dict of the request counters"""
+        return {"requests": self.requests, "saved": self.saved, "in_flight": len(self._in_flight)}
+
+
+Flights = SingleFlight()
+
+
+
+
+class ValidationUnavailable(Exception):
+    """Raised instead of fetching from youtube while the CircuitBreaker is open"""
+    def __init__(self, retry_in):
+        self.retry_in = retry_in #seconds
+        super().__init__(f"youtube validation unavailable, try again in {retry_in:.0f} seconds")
+
+
+class CircuitBreaker:
+    """Stops calling youtube for a while once too many fetches fail (throttling, network blips), 
+    so callers fail fast instead of piling up slow requests. After a jittered, exponentially growing 
+    delay one 'half-open' probe is let through: success closes the breaker, failure opens it again"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    FAILURES = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+                 base_delay=BREAKER_BASE_DELAY, max_delay=BREAKER_MAX_DELAY, jitter=BREAKER_JITTER):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+        self.state = self.CLOSED
+        self.rejected = 0
+        self._outcomes = collections.deque(maxlen=window) #True for success
+        self._num_opens = 0 #in a row, for the backoff
+        self._retry_at = 0.0 #time.monotonic() the breaker goes half-open
+        self._is_probing = False
+
+
+    def _open(self, now):
+        """Opens the breaker for the next backoff delay"""
+        self._num_opens += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self._num_opens - 1))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._retry_at = now + delay
+        self.state = self.OPEN
+        self._outcomes.clear()
+        Logger.info("Youtube circuit breaker opened for %.0f seconds (time #%s in a row)", delay, self._num_opens)
+
+
+    def allow(self, now=None):
+        """Returns bool of whether a fetch can go ahead"""
+        if now is None:
+            now = time.monotonic()
+
+        if self.state == self.OPEN and now >= self._retry_at:
+            self.state = self.HALF_OPEN
+            Logger.info("Youtube circuit breaker half-open, probing...")
+
+        if self.state == self.HALF_OPEN:
+            if self._is_probing:
+                return False #only the one probe at a time
+            self._is_probing = True
+            return True
+        return self.state == self.CLOSED
+
+
+    def record(self, is_success, now=None):
+        """Records the outcome of a fetch that allow() let through"""
+        if now is None:
+            now = time.monotonic()
+
+        if self.state == self.HALF_OPEN:
+            self._is_probing = False
+            if is_success:
+                self.state = self.CLOSED
+                self._num_opens = 0
+                Logger.info("Youtube circuit breaker closed again")
+            else:
+                self._open(now)
+        elif self.state == self.CLOSED:
+            self._outcomes.append(is_success)
+            num_failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and num_failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+
+    async def call(self, async_func, *args):
+        """Returns the result of 'async_func(*args)', raises ValidationUnavailable if the breaker won't allow it"""
+        if not self.allow():
+            self.rejected += 1
+            raise ValidationUnavailable(max(0.0, self._retry_at - time.monotonic()))
+        try:
+            result = await async_func(*args)
+        except self.FAILURES:
+            self.record(False)
+            raise
+        except BaseException:
+            self._is_probing = False #cancelled or a bug, neither says anything about youtube
+            raise
+        self.record(True)
+        return result
+
+
+    def stats(self):
+        """Returns dict of the breaker state and counters"""
+        return {"state": self.state, "rejected": self.rejected, "opens_in_a_row": self._num_opens}
+
+
+Breaker = CircuitBreaker()
+
+
+
+
+### YouTube http session helper functions
+async def _openSession():
+    """Returns the shared aiohttp.ClientSession, making it first if needed. 
+    Has to be called from inside the event loop, e.g. in on_ready()"""
+    global Session
+    if Session is None or Session.closed:
+        Connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT, 
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST, 
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS
+            )
+        Session = aiohttp.ClientSession(connector=Connector, timeout=HTTP_TIMEOUT)
+        Logger.info("Opened youtube http session, pool limit: %s", HTTP_POOL_LIMIT)
+    return Session
+
+
+async def _closeSession():
+    """Closes the shared aiohttp.ClientSession if it is open"""
+    global Session
+    if Session is not None and not Session.closed:
+        await Session.close()
+        Logger.info("Closed youtube http session")
+    Session = None
+
+
+async def _fetchPage(url):
+    """Returns (int, bytes) of the http status and body of 'url' (str), using the shared session"""
+    Client = await _openSession()
+    async with Client.get(url) as R:
+        R.raise_for_status() #a throttled/error page mustn't be parsed (and cached) as a real one
+        content = await R.read()
+        return R.status, content
+
+
+class PageHeadScanner:
+    """Watches a youtube watch page arrive chunk by chunk, to tell when the rest of it isn't needed.
+    That is once the title meta tag and the author's channel link tag have both been seen, or 
+    '</head>' has gone past without a title (the title meta tag only lives in the head)"""
+    HEAD_END = b"</head>"
+    OVERLAP_BYTES = 1024 #rescanned each chunk in case a tag got split between chunks
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.has_title = False
+        self.has_channel = False
+        self.is_head_over = False
+        self._scanned = 0
+
+
+    def feed(self, chunk):
+        """Adds 'chunk' (bytes) to the buffer. Returns bool of whether reading can stop"""
+        self.buffer += chunk
+        start = max(0, self._scanned - self.OVERLAP_BYTES)
+        self._scanned = len(self.buffer)
+
+        if not self.has_title:
+            self.has_title = TITLE_META_REGEX.search(self.buffer, start) is not None
+        if not self.has_channel:
+            for match in URL_LINK_REGEX.finditer(self.buffer, start):
+                if b"/channel/" in match.group():
+                    self.has_channel = True
+                    break
+        if not self.is_head_over:
+            self.is_head_over = self.buffer.find(self.HEAD_END, start) != -1
+
+        return (self.has_title and self.has_channel) or (self.is_head_over and not self.has_title)
+
+
+async def _fetchPageHead(url, max_bytes=STREAM_MAX_BYTES, chunk_bytes=STREAM_CHUNK_BYTES):
+    """Returns (int, bytes) like _fetchPage(), but streams the body and closes the connection 
+    as soon as PageHeadScanner has what it needs, or after 'max_bytes'"""
+    Client = await _openSession()
+    async with Client.get(url) as R:
+        R.raise_for_status()
+        Scanner = PageHeadScanner()
+        is_done = False
+        async for chunk in R.content.iter_chunked(chunk_bytes):
+            is_done = Scanner.feed(chunk)
+            if is_done or len(Scanner.buffer) >= max_bytes:
+                break
+
+        if not R.content.at_eof():
+            R.close() #drop the connection rather than downloading the rest of the page
+        Logger.debug("Streamed %s bytes of %s, stopped early: %s", len(Scanner.buffer), url, is_done)
+        return R.status, bytes(Scanner.buffer[:max_bytes])
+
+
+FETCHERS = {"full": _fetchPage, "stream": _fetchPageHead}
+
+
+async def _fetch(url, mode=None):
+    """Returns (int, bytes) of 'url' (str) fetched with the FETCHERS 'mode' (str), FETCH_MODE by default"""
+    return await FETCHERS[mode or FETCH_MODE](url)
+
+
+def _runBlocking(async_func, *args):
+    """Returns the result of awaiting 'async_func(*args)' for code outside of the event loop 
+    (scripts, REPL). The session made for it is closed afterwards"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass #no loop running, which is what we want
+    else:
+        raise RuntimeError(f"{async_func.__name__}() has to be awaited inside the event loop")
+
+    async def runOnce():
+        try:
+            return await async_func(*args)
+        finally:
+            await _closeSession()
+
+    return asyncio.run(runOnce())
+
+
+
+
 ### User input (parsing?) helper functions
-def _isYoutube(url):
-    """Returns bool and str. Bool for whether 'url' (str) is a youtube video url,
-    and str of the youtube video's title if it is legit."""
+def _extractFromTree(html):
+    """Returns bool and str of whether the BeautifulSoup 'html' is an official Stryper video 
+    and its title. The title is None if there isn't one"""
     is_youtube = False
-    key_str = "https://www.youtube.com/watch?v="
-    if key_str in url:
-        R = requests.get(url)
-        Logger.debug("Requests status: %s", R.status_code)
-        html = BeautifulSoup(R.content, features="html.parser")
-        if html is not None:
-
-            for tag in html.find_all("link", attrs={'itemprop':'url'}): #simplest and first spot to find ...
-                if "href" in tag.attrs.keys(): #HTML tag 'link' would have to have a href right?
-                    if (tag.attrs['href'] == "http://www.youtube.com/channel/UC20qdRIIoh4Xr6jnmZ4HBng"): #...stryper's official channel URL
-                        is_youtube = True
-            #get title
-            result = html.find("meta", attrs={"name":"title"})
-            if result is None:
-                Logger.debug("meta tag with title not found in url, %s", url)
-                return False, ""
-            else:
-                title = result.attrs["content"]
-                Logger.info("in _isYoutube, is_youtube: %s, title: %s", is_youtube, title)
-                return is_youtube, title
-        else:
-            Logger.debug("html is None, weird url??? '%s'", url)
-            return False, ""
+    for tag in html.find_all("link", attrs={'itemprop':'url'}): #simplest and first spot to find ...
+        if "href" in tag.attrs.keys(): #HTML tag 'link' would have to have a href right?
+            if (tag.attrs['href'] == STRYPER_CHANNEL_URL): #...stryper's official channel URL
+                is_youtube = True
+    #get title
+    result = html.find("meta", attrs={"name":"title"})
+    if result is None:
+        return is_youtube, None
+    return is_youtube, result.attrs.get("content")
+
+
+def _extractSoup(content):
+    """Returns bool and str (or None), like _extractFromTree(), from a full html.parser tree of 'content'"""
+    return _extractFromTree(BeautifulSoup(content, features="html.parser"))
+
+
+def _extractStrainer(content):
+    """Returns bool and str (or None), like _extractFromTree(), but only 'link' and 'meta' tags 
+    are parsed into the tree"""
+    only_tags = SoupStrainer(["link", "meta"])
+    return _extractFromTree(BeautifulSoup(content, features="html.parser", parse_only=only_tags))
+
+
+def _extractRegex(content):
+    """Returns bool and str (or None), like _extractFromTree(), without building a tree at all. 
+    Just the precompiled tag patterns and their attributes"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    is_youtube = False
+    stryper_href = STRYPER_CHANNEL_URL.encode("utf-8")
+    for match in URL_LINK_REGEX.finditer(content):
+        attrs = dict(TAG_ATTR_REGEX.findall(match.group()))
+        if attrs.get(b"href") == stryper_href:
+            is_youtube = True
+            break
+
+    title = None
+    match = TITLE_META_REGEX.search(content)
+    if match is not None:
+        attrs = dict(TAG_ATTR_REGEX.findall(match.group()))
+        if b"content" in attrs:
+            title = html.unescape(attrs[b"content"].decode("utf-8", errors="replace"))
+    return is_youtube, title
+
+
+EXTRACTORS = {"soup": _extractSoup, "strainer": _extractStrainer, "regex": _extractRegex}
+
+
+def _parseYoutubePage(content, url="", engine=None):
+    """Returns bool and str. Bool for whether the page 'content' (bytes or str) is an official 
+    Stryper youtube video, and str of the youtube video's title if it is legit. 
+    'engine' (str) is one of EXTRACTORS, EXTRACTOR_ENGINE by default"""
+    engine = engine or EXTRACTOR_ENGINE
+    is_youtube, title = EXTRACTORS[engine](content)
+    if title is None and engine != EXTRACTOR_FALLBACK:
+        Logger.debug("'%s' extractor found no title in %s, falling back to '%s'", engine, url, EXTRACTOR_FALLBACK)
+        is_youtube, title = EXTRACTORS[EXTRACTOR_FALLBACK](content)
+
+    if title is None:
+        Logger.debug("meta tag with title not found in url, %s", url)
+        return False, ""
+    else:
+        Logger.info("in _parseYoutubePage, is_youtube: %s, title: %s", is_youtube, title)
+        return is_youtube, title
+
+
+async def _isYoutubeAsync(url):
+    """Returns bool and str. Bool for whether 'url' (str) is a youtube video url,
+    and str of the youtube video's title if it is legit. Doesn't block the event loop"""
+    if YT_VIDEO_KEY_STR in url:
+        status, content = await _fetch(url)
+        Logger.debug("Requests status: %s", status)
+        #parsing a whole watch page is slow enough to hold up the event loop, so do it in a thread
+        return await asyncio.to_thread(_parseYoutubePage, content, url)
     else:
-        Logger.info("url (%s) doesn't contain '%s', automatic fail", url, key_str)
+        Logger.info("url (%s) doesn't contain '%s', automatic fail", url, YT_VIDEO_KEY_STR)
         return False, ""
+
+
+def _isYoutube(url):
+    """Blocking version of _isYoutubeAsync(), for use outside of the event loop"""
+    return _runBlocking(_isYoutubeAsync, url)
     
 
-def _cleanYoutubeURL(url):
-    """Returns str. Gets rid of extra unneccessary data in url (str)"""
-    Logger.info("cleaning youtube url...")
-    cut_off_index = url.find("&") #first one found is returned, which is the start of extra needless data in url
+def _findVideoIDs(text):
+    """Returns list of every youtube video ID (str) linked in 'text' (str), in order and without repeats. 
+    No network I/O, just YT_VIDEO_ID_REGEX"""
+    if "youtu" not in text: #cheap check, as most messages don't have a link at all
+        return []
+    return list(dict.fromkeys(YT_VIDEO_ID_REGEX.findall(text)))
+
+
+def _getVideoID(url):
+    """Returns str of the video ID of the first youtube video link in 'url' (str), or None if there isn't one"""
+    if "youtu" in url:
+        match = YT_VIDEO_ID_REGEX.search(url)
+        if match is not None:
+            return match.group(1)
+    return None
 
-    if cut_off_index != -1: 
-        yt_url = url[:cut_off_index]
-    else:
-        yt_url = url
-    Logger.info("url parameters removed: %s", yt_url)
-    #If people want to suppress preview of a link, eg. <link string>, the angle brackets need to be removed
-    if yt_url[0] == '<':
-        yt_url = yt_url[1:]
-        Logger.info("Removed '<', %s", yt_url)
 
-    if yt_url[-1] == '>':
-        yt_url = yt_url[:-1]
-        Logger.info("Removed '>', %s", yt_url)
+def _videoURL(video_id):
+    """Returns str of the canonical url of 'video_id' (str). Used to store and compare songs"""
+    return YT_VIDEO_KEY_STR + video_id
 
+
+def _cleanYoutubeURL(url):
+    """Returns str. The canonical form of the youtube video url (str), which gets rid of extra 
+    unneccessary data like other parameters or '<>' link suppression. 'url' is returned as is 
+    if it isn't a youtube video link"""
+    video_id = _getVideoID(url)
+    if video_id is None:
+        Logger.info("No youtube video ID in url: %s", url)
+        return url
+    yt_url = _videoURL(video_id)
     Logger.info("Cleaned youtube url: %s", yt_url)
     return yt_url
 
 
-def _validateYoutubeURL(url):
+async def _lookupVideo(video_id, clean_url):
+    """Returns bool and str like _isYoutubeAsync(), and caches the answer under 'video_id' (str). 
+    Network failures aren't cached, only actual answers"""
+    is_youtube, yt_title = await Breaker.call(_isYoutubeAsync, clean_url)
+    MetaCache.put(video_id, is_youtube, yt_title)
+    return is_youtube, yt_title
+
+
+def _validationStats():
+    """Returns dict of the metadata cache, single-flight and circuit breaker counters"""
+    return {"cache": MetaCache.stats(), "single_flight": Flights.stats(), "breaker": Breaker.stats()}
+
+
+async def _validateYoutubeURLAsync(url):
     """Returns bool as to whether 'url' (str) is legit 
-    and if it is actually a youtube video link"""
+    and if it is actually a youtube video link, the video's title (or error message) str, 
+    and the cleaned url str. Doesn't block the event loop"""
     Logger.info("Validating youtube url...")
-    key_str = "https://www.youtube.com/watch?v="
-    if key_str in url:
-        clean_url = _cleanYoutubeURL(url)
-        is_valid_url = bool(validators.url(clean_url))
-        
-        if is_valid_url:
-            Logger.info("Valid url is cleaned to: %s", clean_url)
-            is_youtube, yt_title = _isYoutube(clean_url)
-            Logger.info("Cleaned url is youtube: %s", is_youtube)
-            return is_youtube, yt_title, clean_url       
+    video_id = _getVideoID(url)
+    if video_id is not None:
+        clean_url = _videoURL(video_id)
+        Logger.info("Url is cleaned to: %s", clean_url)
+
+        meta = await MetaCache.getAsync(video_id)
+        if meta is not None:
+            Logger.info("Video metadata of %s is cached", video_id)
+            is_youtube, yt_title = meta.is_stryper_channel, meta.title
         else:
-            msg = "Invalid url (not reachable): " + clean_url
-            Logger.debug(msg)
-            return False, msg, clean_url
+            try:
+                is_youtube, yt_title = await Flights.do(video_id, _lookupVideo, video_id, clean_url)
+            except ValidationUnavailable as e:
+                msg = f"Couldn't check {clean_url}, {e}"
+                Logger.debug(msg)
+                return False, msg, clean_url
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                msg = "Couldn't reach youtube to check: " + clean_url
+                Logger.debug("%s, %r", msg, e)
+                return False, msg, clean_url
+        Logger.info("Cleaned url is youtube: %s", is_youtube)
+        return is_youtube, yt_title, clean_url       
     else:
-        msg = f"'{url}' invalid, doesn't contain at least '{key_str}'"
+        msg = f"'{url}' invalid, isn't a youtube video link"
         Logger.info(msg + ", automatic fail")
         return False, msg, url
 
 
+async def _validateMany(urls, max_concurrency=VALIDATE_MAX_CONCURRENCY, timeout=VALIDATE_TIMEOUT):
+    """Returns list of (bool, str, str) like _validateYoutubeURLAsync(), one for each of 'urls' 
+    in the same order. Up to 'max_concurrency' urls are validated at once, and each gets 'timeout' 
+    seconds. A url that times out or errors gets a False result with the error message, 
+    the rest of the batch carries on"""
+    Semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def validateOne(url):
+        async with Semaphore:
+            try:
+                return await asyncio.wait_for(_validateYoutubeURLAsync(url), timeout)
+            except asyncio.TimeoutError:
+                msg = f"Timed out validating '{url}' after {timeout} seconds"
+            except Exception as e:
+                msg = f"Error validating '{url}': {e!r}"
+            Logger.debug(msg)
+            return False, msg, url
+
+    Logger.info("Validating %s urls, %s at a time", len(urls), max_concurrency)
+    return await asyncio.gather(*(validateOne(url) for url in urls))
+
+
+async def _prewarmCache(urls, max_concurrency=PREWARM_MAX_CONCURRENCY, interval=PREWARM_INTERVAL):
+    """Fills MetaCache for every youtube video in 'urls' (list of str) that isn't already cached. 
+    Meant to run as a background task, so fetches start at most every 'interval' seconds with 
+    'max_concurrency' at a time, and it stops early if the circuit breaker opens. 
+    Returns the number of videos fetched"""
+    start = time.monotonic()
+    video_ids = [video_id for video_id in dict.fromkeys(map(_getVideoID, urls)) if video_id is not None]
+    #this also moves anything found in the cache file into memory, reading the file in one go off the loop
+    cached = await MetaCache.getManyAsync(video_ids)
+    to_fetch = [video_id for video_id in video_ids if video_id not in cached]
+    Logger.info("Prewarming video cache: %s videos, %s to fetch", len(video_ids), len(to_fetch))
+
+    Semaphore = asyncio.Semaphore(max_concurrency)
+    num_done = 0
+
+    async def warmOne(video_id):
+        #straight to the fetch, the cache was already checked above and a prewarm shouldn't count as misses
+        nonlocal num_done
+        try:
+            await Flights.do(video_id, _lookupVideo, video_id, _videoURL(video_id))
+        except (ValidationUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            Logger.debug("Prewarming video cache: couldn't fetch %s, %r", video_id, e)
+            return
+        finally:
+            Semaphore.release()
+        num_done += 1
+        if num_done % PREWARM_LOG_EVERY == 0:
+            Logger.info("Prewarming video cache: %s/%s fetched", num_done, len(to_fetch))
+
+    Tasks = []
+    for video_id in to_fetch:
+        await Semaphore.acquire()
+        if Breaker.state != CircuitBreaker.CLOSED:
+            Semaphore.release()
+            Logger.info("Prewarming video cache stopped early, youtube circuit breaker is %s", Breaker.state)
+            break
+        Tasks.append(asyncio.ensure_future(warmOne(video_id)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*Tasks)
+
+    Logger.info("Prewarming video cache done: %s/%s fetched in %.1f seconds", 
+                num_done, len(to_fetch), time.monotonic() - start)
+    return num_done
+
+
+def _validateYoutubeURL(url):
+    """Blocking version of _validateYoutubeURLAsync(), kept for scripts and the REPL. 
+    Bot code has to 'await h_functions._validateYoutubeURLAsync(url)' instead"""
+    return _runBlocking(_validateYoutubeURLAsync, url)
+
+
 def _validateRating(rating_str):
     """Returns bool as to whether rating is valid"""
     try:
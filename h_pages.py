@@ -0,0 +1,97 @@
+"""
+Paged embeds with buttons, for listing the songs and templates without running into Discord's message limits
+"""
+import math
+import logging
+
+import discord
+
+Logger = logging.getLogger( __name__)
+
+PAGE_SIZE = 10 #entries per page
+LINE_MAX_CHARS = 380 #an entry longer than this is cut off, so a full page stays under the 4096 char embed limit
+VIEW_TIMEOUT = 300 #seconds after the last button press that the buttons stop working
+TITLE_MAX_CHARS = 256 #embed title limit
+
+
+def _shorten(text, max_chars=LINE_MAX_CHARS):
+    """Returns str of 'text' cut off at 'max_chars', with an ellipsis if it was"""
+    if len(text) > max_chars:
+        return text[:max_chars - 1] + "…"
+    return text
+
+
+
+class PagedList(discord.ui.View):
+    """Embed pages of a list with buttons to go back and forth. 'count' (function) returns the number of
+    entries and 'line' (function taking an int index) returns the str of one, so only the entries of the
+    page being shown are ever rendered, straight from the store, and the list can change in between.
+    Only 'author_id' (int) can press the buttons, if given"""
+
+    def __init__(self, title, count, line, page_size=PAGE_SIZE, author_id=None, timeout=VIEW_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.title = title
+        self.count = count
+        self.line = line
+        self.page_size = page_size
+        self.author_id = author_id
+        self.page = 0
+        self.Message = None #discord.Message the view is on, set by whoever sends it
+
+
+    def numPages(self, num_entries):
+        return max(1, math.ceil(num_entries / self.page_size))
+
+
+    def render(self):
+        """Returns discord.Embed of the current page, and updates the buttons to match"""
+        num_entries = self.count()
+        num_pages = self.numPages(num_entries)
+        self.page = min(max(self.page, 0), num_pages - 1) #entries may have been removed since
+        start = self.page * self.page_size
+
+        lines = [_shorten(self.line(i)) for i in range(start, min(start + self.page_size, num_entries))]
+        Embed = discord.Embed(title=_shorten(self.title, TITLE_MAX_CHARS), description="\n".join(lines) or "Nothing here yet")
+        Embed.set_footer(text=f"Page {self.page + 1}/{num_pages}, {num_entries} in all")
+        self.first.disabled = self.previous.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page == num_pages - 1
+        return Embed
+
+
+    async def _show(self, Interaction, page):
+        self.page = page
+        await Interaction.response.edit_message(embed=self.render(), view=self)
+
+
+    async def interaction_check(self, Interaction):
+        return self.author_id is None or Interaction.user.id == self.author_id
+
+
+    async def on_timeout(self):
+        for Item in self.children:
+            Item.disabled = True
+        if self.Message is not None:
+            try:
+                await self.Message.edit(view=self)
+            except discord.HTTPException:
+                pass #deleted in the meantime
+
+
+    @discord.ui.button(label="⏮", style=discord.ButtonStyle.secondary)
+    async def first(self, Interaction, Button):
+        await self._show(Interaction, 0)
+
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
+    async def previous(self, Interaction, Button):
+        await self._show(Interaction, self.page - 1)
+
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
+    async def next(self, Interaction, Button):
+        await self._show(Interaction, self.page + 1)
+
+
+    @discord.ui.button(label="⏭", style=discord.ButtonStyle.secondary)
+    async def last(self, Interaction, Button):
+        await self._show(Interaction, self.numPages(self.count()) - 1)
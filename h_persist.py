@@ -0,0 +1,631 @@
+"""
+Persistence of the Bot's data file, kept apart from the in-memory stores in h_store
+"""
+import os
+import json
+import shutil
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import tempfile
+import functools
+import concurrent.futures
+
+import h_functions
+
+Logger = logging.getLogger( __name__)
+
+WRITE_BEHIND_DELAY = 2.0 #seconds, mutations within this window of the first are written together
+GROUP_COMMIT_WINDOW = 0.05 #seconds, commit()s within this window share one write. None to write on every commit()
+JOURNAL_COMPACT_BYTES = 256 * 1024 #the journal is folded into the data file once it gets this big
+
+#mutation records passed from the stores to a persister, with their payloads
+ADD_SONG = "add_song" #{"song": dict}
+UPDATE_SONG = "update_song" #{"url": str, "rating": ..., "notes": ...}
+REMOVE_SONG = "remove_song" #{"url": str}
+ADD_TEMPLATE = "add_template" #{"template": str}
+REMOVE_TEMPLATE = "remove_template" #{"template": str}
+
+
+### crash-safe file helper functions
+def _fsyncFolder(folder):
+    """Flushes the folder entry itself to disk, so a rename in it survives a crash. POSIX only"""
+    if os.name == "posix":
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _atomicWrite(path, text):
+    """Writes 'text' (str) to 'path' so that readers, and a crash at any point, only ever see the 
+    old file or the new one. It goes to a temp file in the same folder, which is fsync'd, 
+    os.replace'd over 'path', and then the folder is fsync'd. Returns tuple (mtime_ns, size, inode) of 
+    the file written (like h_watch._signature()), taken before the replace so a later edit can't be mistaken for it"""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path) #mkstemp makes it owner only
+        stat = os.stat(temp_path) #a rename keeps the inode and mtime
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    _fsyncFolder(folder)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+
+class Persister:
+    """Base of the persisters. Mutations only mark the data dirty, and are written once, 'delay' 
+    seconds after the first of them (write-behind). Callers needing durability await commit(), 
+    and commits within 'group_window' seconds share one write (group commit). 
+
+    All file I/O and serialisation happens on one dedicated thread, so writes stay in order and the 
+    event loop only ever touches memory: _prepare() takes what a write needs on the loop (which is 
+    cheap, the stores hand out immutable records), and _write() does the rest on the I/O thread. 
+    One write is in flight at a time. Subclasses do load(), record(), _prepare(), _write() and rewrite()"""
+
+    def __init__(self, path, delay=WRITE_BEHIND_DELAY, group_window=GROUP_COMMIT_WINDOW):
+        self.path = path
+        self.delay = delay
+        self.group_window = group_window
+
+        self.num_writes = 0
+        self.is_dirty = False
+        self.on_write = None #function(signature) called after each write, e.g. so a file watcher knows it was us.
+                             #the signature is from _atomicWrite(), None if the data file wasn't rewritten
+        self._Timer = None #asyncio.TimerHandle of the pending write
+        self._Commit = None #asyncio.Future resolved by the next write, shared by everyone in commit()
+        self._Writing = None #asyncio.Future of the write in flight, resolved once it is on disk
+        self._Executor = None #the I/O thread, a single worker concurrent.futures.ThreadPoolExecutor
+        self.is_writable = True #False holds every write back, e.g. until the data has been loaded
+
+
+    def load(self):
+        """Returns dict of the whole database, laid out like the data file. Blocking, see loadAsync()"""
+        raise NotImplementedError
+
+
+    def record(self, op, payload):
+        """Called by the stores after each mutation, 'op' is one of the mutation records above"""
+        Logger.debug("mutation recorded: %s %s", op, payload)
+        self._markDirty()
+
+
+    def touch(self):
+        """Marks the data as changed, for owners that don't have mutation records and just write the whole snapshot"""
+        self._markDirty()
+
+
+    def _prepare(self):
+        """Returns what the next _write() needs, on the event loop. Everything recorded so far is in it"""
+        raise NotImplementedError
+
+
+    def _write(self, job):
+        """Makes 'job' from _prepare() durable, on the I/O thread. Returns the signature from _atomicWrite() 
+        if it rewrote the data file, else None"""
+        raise NotImplementedError
+
+
+    def _restore(self, job):
+        """Puts 'job' from _prepare() back after its _write() failed, so the next one has it again"""
+        pass
+
+
+    def _forget(self):
+        """Drops whatever is queued for the next _write(), for discard()"""
+        pass
+
+
+    def rewrite(self, data):
+        """Replaces the whole database with 'data' (dict laid out like the data file) straight away, 
+        e.g. after migrating it to a new schema version. Blocking, run it on the I/O thread with run()"""
+        raise NotImplementedError
+
+
+    def _executor(self):
+        if self._Executor is None:
+            self._Executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="h_persist")
+        return self._Executor
+
+
+    async def run(self, func, *args):
+        """Returns the result of 'func'(*args) run on the I/O thread, after any write already in flight"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), func, *args)
+
+
+    async def loadAsync(self):
+        """Returns dict of the whole database like load(), reading it on the I/O thread"""
+        return await self.run(self.load)
+
+
+    def _markDirty(self):
+        if self.is_dirty and (self._Timer is not None or self._Writing is not None):
+            return #a write is coming already and will have it, e.g. in a burst of mutations
+        self.is_dirty = True
+        if not self._schedule(self.delay):
+            self.flush() #no event loop (scripts), nothing to write behind with
+
+
+    def _schedule(self, delay):
+        """Makes sure a write starts within 'delay' seconds. Returns False if there is no event loop"""
+        try:
+            Loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if self._Timer is not None:
+            if self._Timer.when() <= Loop.time() + delay:
+                return True #already happening soon enough
+            self._Timer.cancel()
+        self._Timer = Loop.call_later(delay, self._startWrite)
+        return True
+
+
+    async def commit(self):
+        """Returns once every mutation recorded so far is safely on disk"""
+        if not self.is_dirty:
+            if self._Writing is not None:
+                await asyncio.shield(self._Writing) #the last of them is being written right now
+            return
+        if self._Commit is None:
+            self._Commit = asyncio.get_running_loop().create_future()
+        Commit = self._Commit
+        self._schedule(self.group_window or 0)
+        await asyncio.shield(Commit)
+
+
+    def _startWrite(self):
+        """Starts writing everything recorded so far on the I/O thread, unless a write is in flight 
+        already, in which case _writeDone() starts the next one"""
+        self._Timer = None
+        if self._Writing is not None:
+            return
+        Commit, self._Commit = self._Commit, None
+        if not self.is_dirty:
+            if Commit is not None:
+                Commit.set_result(None)
+            return
+        if not self.is_writable:
+            Logger.error("Not writing '%s', it isn't writable (not loaded yet?)", self.path)
+            if Commit is not None:
+                Commit.set_exception(RuntimeError(f"'{self.path}' isn't writable"))
+                Commit.exception() #it's fine if nobody was waiting for it
+            return
+
+        self.is_dirty = False
+        job = self._prepare()
+        Loop = asyncio.get_running_loop()
+        self._Writing = Commit if Commit is not None else Loop.create_future()
+        Done = Loop.run_in_executor(self._executor(), self._write, job)
+        Done.add_done_callback(functools.partial(self._writeDone, job, self._Writing))
+
+
+    def _writeDone(self, job, Writing, Done):
+        self._Writing = None
+        error = Done.exception()
+        if error is None:
+            self._wrote(Done.result())
+            Writing.set_result(None)
+        else:
+            Logger.error("Writing '%s' failed, trying again in %s seconds", self.path, self.delay, exc_info=error)
+            self._restore(job)
+            self.is_dirty = True
+            Writing.set_exception(error)
+            Writing.exception() #it's fine if nobody was waiting for it
+        
+        if self.is_dirty: #recorded while this write was in flight, or it failed
+            self._schedule(self.group_window or 0 if self._Commit is not None else self.delay)
+
+
+    def _wrote(self, signature):
+        self.num_writes += 1
+        Logger.info("Wrote '%s' (write #%s)", self.path, self.num_writes)
+        if self.on_write is not None:
+            self.on_write(signature)
+
+
+    def flush(self):
+        """Writes now if there are unwritten mutations, blocking until it is done (after any write in flight). 
+        For scripts and shutdown, inside the event loop use flushAsync()"""
+        if self._Timer is not None:
+            self._Timer.cancel()
+            self._Timer = None
+        Commit, self._Commit = self._Commit, None
+        if self.is_dirty and not self.is_writable:
+            Logger.error("Not writing '%s', it isn't writable (not loaded yet?)", self.path)
+            if Commit is not None and not Commit.done():
+                Commit.set_exception(RuntimeError(f"'{self.path}' isn't writable"))
+                Commit.exception()
+            return
+
+        if self.is_dirty:
+            self.is_dirty = False
+            job = self._prepare()
+            try:
+                signature = self._executor().submit(self._write, job).result()
+            except Exception as e:
+                self._restore(job)
+                self.is_dirty = True
+                if Commit is not None:
+                    Commit.set_exception(e)
+                raise
+            self._wrote(signature)
+
+        if Commit is not None and not Commit.done():
+            Commit.set_result(None)
+
+
+    async def flushAsync(self):
+        """Writes now if there are unwritten mutations, returning once they (and any write in flight) are on disk"""
+        while self._Writing is not None:
+            await asyncio.shield(self._Writing)
+        if self.is_dirty and not self.is_writable:
+            Logger.error("Not writing '%s', it isn't writable (not loaded yet?)", self.path)
+            return
+        if self.is_dirty:
+            self._Commit = self._Commit or asyncio.get_running_loop().create_future()
+            Commit = self._Commit
+            self._startWrite()
+            await asyncio.shield(Commit)
+
+
+    def discard(self):
+        """Forgets the unwritten mutations, when the file was replaced from outside and wins"""
+        if self._Timer is not None:
+            self._Timer.cancel()
+            self._Timer = None
+        Commit, self._Commit = self._Commit, None
+        self.is_dirty = False
+        self._forget()
+        if Commit is not None and not Commit.done():
+            Commit.set_result(None)
+
+
+    def _release(self):
+        """Closes whatever the persister has open, on the I/O thread"""
+        pass
+
+
+    def close(self):
+        """Writes anything left and stops the I/O thread, the persister isn't used after this. Blocking"""
+        self.flush()
+        self._executor().submit(self._release).result()
+        self._Executor.shutdown()
+        self._Executor = None
+
+
+    async def closeAsync(self):
+        """close() without blocking the event loop"""
+        await self.flushAsync()
+        await self.run(self._release)
+        self._Executor.shutdown()
+        self._Executor = None
+
+
+
+class JsonPersister(Persister):
+    """Persistence of the whole data file as JSON, always rewritten in full with _atomicWrite()"""
+
+    def __init__(self, path, snapshot, indent=4, delay=WRITE_BEHIND_DELAY, group_window=GROUP_COMMIT_WINDOW):
+        super().__init__(path, delay, group_window)
+        self.snapshot = snapshot #function returning the dict to write
+        self.indent = indent
+
+
+    def load(self):
+        """Returns dict of the whole data file"""
+        with open(self.path, "r", encoding="utf-8") as read_file:
+            return json.load(read_file)
+
+
+    def _prepare(self):
+        return self.snapshot() #new lists of new dicts, nothing the loop changes while it is serialised
+
+
+    def _write(self, data):
+        return _atomicWrite(self.path, json.dumps(data, indent=self.indent))
+
+
+    def rewrite(self, data):
+        signature = _atomicWrite(self.path, json.dumps(data, indent=self.indent))
+        if self.on_write is not None:
+            self.on_write(signature)
+
+
+
+class JournalPersister(JsonPersister):
+    """Persistence as the data file plus an append-only journal next to it ('path' + ".journal"). 
+    A write appends one line per mutation record and fsyncs, so it costs the size of the changes 
+    rather than of the database. Once the journal passes 'compact_bytes' it is compacted: the data 
+    file is rewritten with _atomicWrite() and the journal emptied. load() replays the journal over 
+    the data file. Every line has a sequence number and the data file remembers the last one folded 
+    into it, so a crash between the two steps of compacting doesn't replay anything twice"""
+
+    def __init__(self, path, snapshot, indent=4, delay=WRITE_BEHIND_DELAY, group_window=GROUP_COMMIT_WINDOW, 
+                 compact_bytes=JOURNAL_COMPACT_BYTES):
+        super().__init__(path, snapshot, indent, delay, group_window)
+        self.journal_path = path + ".journal"
+        self.compact_bytes = compact_bytes
+        self.seq = 0 #sequence number of the last mutation recorded
+        self.num_compactions = 0
+        self._pending = [] #journal lines not appended yet
+        self._journal_size = 0 #about how many bytes the journal will have once the pending lines are appended
+
+
+    def load(self):
+        """Returns dict of the data file with the journal replayed over it"""
+        data = super().load()
+        snapshot_seq = data.pop("journal_seq", 0)
+        self.seq = snapshot_seq
+        num_lines = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+                for num_lines, line in enumerate(journal_file, 1):
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        Logger.warning("Ignoring the torn end of '%s' from line %s", self.journal_path, num_lines)
+                        break
+                    if entry["seq"] > self.seq: #older lines are already in the data file, or were appended twice
+                        _applyMutation(data, entry["op"], entry["payload"])
+                        self.seq = entry["seq"]
+
+        if num_lines:
+            Logger.info("Replayed %s mutations from '%s'", self.seq - snapshot_seq, self.journal_path)
+            self._compact(data, self.seq) #so the next append doesn't follow a torn line, and the journal starts empty
+        self._journal_size = 0
+        return data
+
+
+    def record(self, op, payload):
+        """Queues the mutation record as a journal line, appended by the next write"""
+        self.seq += 1
+        self._pending.append(json.dumps({"seq": self.seq, "op": op, "payload": payload}) + "\n")
+        super().record(op, payload)
+
+
+    def _prepare(self):
+        """Returns (str, tuple or None) of the lines to append, and (data dict, seq) to compact into 
+        once the journal is big enough. The snapshot has to be taken here, in step with the lines"""
+        lines = "".join(self._pending)
+        self._pending = []
+        self._journal_size += len(lines)
+        compaction = None
+        if self._journal_size >= self.compact_bytes:
+            compaction = (self.snapshot(), self.seq)
+            self._journal_size = 0
+        return lines, compaction
+
+
+    def _write(self, job):
+        lines, compaction = job
+        is_new = not os.path.exists(self.journal_path)
+        with open(self.journal_path, "a", encoding="utf-8") as journal_file:
+            journal_file.write(lines)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        if is_new:
+            _fsyncFolder(os.path.dirname(os.path.abspath(self.journal_path)))
+
+        if compaction is not None:
+            return self._compact(*compaction)
+        return None
+
+
+    def _restore(self, job):
+        lines, compaction = job
+        self._pending.insert(0, lines) #lines that did make it are skipped by their seq when replayed
+        if compaction is not None:
+            self._journal_size = self.compact_bytes
+
+
+    def _forget(self):
+        self._pending = []
+
+
+    def rewrite(self, data):
+        self._compact(data, self.seq)
+
+
+    def _compact(self, data, seq):
+        """Rewrites the data file with 'data' (dict) as of mutation 'seq' (int), then empties the journal. 
+        Returns the signature from _atomicWrite()"""
+        signature = _atomicWrite(self.path, json.dumps(dict(data, journal_seq=seq), indent=self.indent))
+        with open(self.journal_path, "w", encoding="utf-8") as journal_file:
+            os.fsync(journal_file.fileno())
+        self.num_compactions += 1
+        Logger.info("Compacted '%s' into '%s' (compaction #%s)", self.journal_path, self.path, self.num_compactions)
+        return signature
+
+
+
+class SqlitePersister(Persister):
+    """Persistence in a sqlite database at 'path' instead of the JSON file. Each mutation record is a 
+    single row statement (songs keyed by video ID, templates by hash), so adding, updating or removing 
+    costs O(log n) no matter how big the database gets. WAL mode, and the statements are parameterised 
+    so sqlite3's statement cache keeps them prepared. If the database is empty on the first load(), 
+    the JSON data file at 'json_path' is migrated into it"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS songs ("
+        "video_id TEXT PRIMARY KEY, position INTEGER NOT NULL, title TEXT NOT NULL, url TEXT NOT NULL, "
+        "rating NUMERIC NOT NULL, notes TEXT NOT NULL)", #notes is JSON, it can be a str or list
+        "CREATE INDEX IF NOT EXISTS songs_position ON songs (position)",
+        "CREATE INDEX IF NOT EXISTS songs_rating ON songs (rating)",
+        "CREATE INDEX IF NOT EXISTS songs_title ON songs (title)",
+        "CREATE TABLE IF NOT EXISTS templates ("
+        "hash TEXT PRIMARY KEY, position INTEGER NOT NULL, template TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS templates_position ON templates (position)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    )
+    #OR IGNORE: the stores never add a duplicate, but a hand edited data file being migrated might have some
+    INSERT_SONG = "INSERT OR IGNORE INTO songs (video_id, position, title, url, rating, notes) VALUES (?, ?, ?, ?, ?, ?)"
+    UPDATE_SONG = "UPDATE songs SET rating = ?, notes = ? WHERE video_id = ?"
+    DELETE_SONG = "DELETE FROM songs WHERE video_id = ?"
+    INSERT_TEMPLATE = "INSERT OR IGNORE INTO templates (hash, position, template) VALUES (?, ?, ?)"
+    DELETE_TEMPLATE = "DELETE FROM templates WHERE hash = ?"
+
+    def __init__(self, path, json_path=None, delay=WRITE_BEHIND_DELAY, group_window=GROUP_COMMIT_WINDOW):
+        super().__init__(path, delay, group_window)
+        self.json_path = json_path
+        self._db = None #only used on the I/O thread, bar load() in scripts
+        self._statements = [] #(sql, params) of the mutations not written yet
+        self._next_song_position = 0
+        self._next_template_position = 0
+
+
+    def _connect(self):
+        """Returns the sqlite3.Connection, making the tables first if needed"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False) #never used by two threads at once
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=FULL") #a commit has to survive a power cut, it is the database
+            for statement in self.SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+        return self._db
+
+
+    def load(self):
+        """Returns dict of the whole database, laid out like the data file"""
+        db = self._connect()
+        has_migrated = db.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone() is not None
+        if not has_migrated: #only ever on the first load of the database, not whenever it happens to be empty
+            is_empty = db.execute("SELECT NOT EXISTS (SELECT 1 FROM songs) AND NOT EXISTS (SELECT 1 FROM templates)").fetchone()[0]
+            if is_empty and self.json_path is not None and os.path.exists(self.json_path):
+                _migrateJsonToSqlite(self.json_path, self)
+            else:
+                with db:
+                    db.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', '')") #nothing
+
+        schema_version = db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        songs = []
+        for title, url, rating, notes in db.execute("SELECT title, url, rating, notes FROM songs ORDER BY position"):
+            songs.append({"title": title, "url": url, "rating": rating, "notes": json.loads(notes)})
+        templates = [row[0] for row in db.execute("SELECT template FROM templates ORDER BY position")]
+
+        self._next_song_position = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM songs").fetchone()[0]
+        self._next_template_position = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM templates").fetchone()[0]
+        return {"schema_version": int(schema_version[0]) if schema_version else 1, "songs": songs, "templates": templates}
+
+
+    def record(self, op, payload):
+        """Queues the mutation record as a single row statement, executed and committed by the next write"""
+        if op == ADD_SONG:
+            song = payload["song"]
+            self._statements.append((self.INSERT_SONG, (_songKey(song["url"]), self._next_song_position, song["title"], 
+                                                        song["url"], song["rating"], json.dumps(song["notes"]))))
+            self._next_song_position += 1
+        elif op == UPDATE_SONG:
+            self._statements.append((self.UPDATE_SONG, (payload["rating"], json.dumps(payload["notes"]), _songKey(payload["url"]))))
+        elif op == REMOVE_SONG:
+            self._statements.append((self.DELETE_SONG, (_songKey(payload["url"]),)))
+        elif op == ADD_TEMPLATE:
+            template = payload["template"]
+            self._statements.append((self.INSERT_TEMPLATE, (_templateHash(template), self._next_template_position, template)))
+            self._next_template_position += 1
+        elif op == REMOVE_TEMPLATE:
+            self._statements.append((self.DELETE_TEMPLATE, (_templateHash(payload["template"]),)))
+        super().record(op, payload)
+
+
+    def _prepare(self):
+        statements, self._statements = self._statements, []
+        return statements
+
+
+    def _write(self, statements):
+        db = self._connect()
+        with db: #one transaction, all or nothing
+            for sql, params in statements:
+                db.execute(sql, params)
+
+
+    def _restore(self, statements):
+        self._statements[:0] = statements
+
+
+    def _forget(self):
+        self._statements = []
+
+
+    def rewrite(self, data):
+        db = self._connect()
+        with db: #one transaction, all or nothing
+            db.execute("DELETE FROM songs")
+            db.execute("DELETE FROM templates")
+            _insertAll(db, data)
+        self._next_song_position = len(data["songs"])
+        self._next_template_position = len(data["templates"])
+
+
+    def _release(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+
+### helper functions, the keys are shared with h_store
+def _songKey(url):
+    """Returns str of the video ID of a song's 'url' (str), its primary key. The url itself if it has no ID"""
+    return h_functions._getVideoID(url) or url
+
+
+def _templateHash(template):
+    """Returns str, the sha1 hex digest of 'template' (str)"""
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()
+
+
+def _applyMutation(data, op, payload):
+    """Applies a mutation record to 'data' (dict laid out like the data file), replaying a journal"""
+    songs, templates = data["songs"], data["templates"]
+    if op == ADD_SONG:
+        songs.append(payload["song"])
+    elif op == UPDATE_SONG or op == REMOVE_SONG:
+        for i, song in enumerate(songs):
+            if song["url"] == payload["url"]:
+                if op == UPDATE_SONG:
+                    song["rating"] = payload["rating"]
+                    song["notes"] = payload["notes"]
+                else:
+                    del songs[i]
+                break
+    elif op == ADD_TEMPLATE:
+        templates.append(payload["template"])
+    elif op == REMOVE_TEMPLATE and payload["template"] in templates:
+        templates.remove(payload["template"])
+
+
+def _insertAll(db, data):
+    """Inserts everything in 'data' (dict laid out like the data file) into the empty sqlite3.Connection 'db'"""
+    for position, song in enumerate(data["songs"]):
+        db.execute(SqlitePersister.INSERT_SONG, (_songKey(song["url"]), position, song["title"], song["url"], 
+                                                 song["rating"], json.dumps(song["notes"])))
+    for position, template in enumerate(data["templates"]):
+        db.execute(SqlitePersister.INSERT_TEMPLATE, (_templateHash(template), position, template))
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(data.get("schema_version", 1)),))
+
+
+def _migrateJsonToSqlite(json_path, Sqlite):
+    """One-shot copy of the JSON data file at 'json_path' into the SqlitePersister 'Sqlite', 
+    which should be empty. The JSON file is left as it is"""
+    with open(json_path, "r", encoding="utf-8") as read_file:
+        data = json.load(read_file)
+    
+    db = Sqlite._connect()
+    with db: #one transaction, all or nothing
+        _insertAll(db, data)
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (os.path.abspath(json_path),))
+    Logger.info("Migrated '%s' into '%s': %s songs, %s templates", 
+                json_path, Sqlite.path, len(data["songs"]), len(data["templates"]))
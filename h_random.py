@@ -0,0 +1,121 @@
+"""
+Random picking of songs: weighted (Vose's alias method) for picking higher rated songs more often, 
+and a shuffle bag for going through every song once before any repeats
+"""
+import random as rand
+import logging
+
+Logger = logging.getLogger( __name__)
+
+RATING_WEIGHT_EXPONENT = 2.0 #weight = rating ** this. 0 for uniform, higher favours the top rated songs more
+RATING_WEIGHT_FLOOR = 0.5 #ratings below this count as this, so a 0/10 song still comes up now and then
+
+
+def _ratingWeight(rating, exponent=RATING_WEIGHT_EXPONENT, floor=RATING_WEIGHT_FLOOR):
+    """Returns float, the weight of a song with 'rating' (number from 0 to 10)"""
+    return max(rating, floor) ** exponent
+
+
+
+class AliasTable:
+    """Picks an index with probability proportional to its weight. O(n) to build from 'weights'
+    (list of non-negative numbers, not all 0), then O(1) per pick no matter how many there are"""
+    __slots__ = ("_probability", "_alias")
+
+    def __init__(self, weights):
+        num_weights = len(weights)
+        total = sum(weights)
+        if num_weights == 0 or total <= 0:
+            raise ValueError("need at least one positive weight")
+
+        self._probability = [1.0] * num_weights #of keeping the column picked, rather than going to its alias
+        self._alias = list(range(num_weights))
+
+        scaled = [weight * num_weights / total for weight in weights] #average 1
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more #the rest of less's column is filled from more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        #whatever is left is 1 bar floating point error, and keeps its default of 1.0
+
+
+    def __len__(self):
+        return len(self._alias)
+
+
+    def pick(self, Random=rand):
+        """Returns int, a random index"""
+        i = Random.randrange(len(self._alias))
+        return i if Random.random() < self._probability[i] else self._alias[i]
+
+
+
+class ShuffleBag:
+    """Hands out keys in a shuffled order, each once, until every key has been drawn, then reshuffles 
+    (a 'bag'). The state is 'order' (list of keys) and 'cursor' (int), where order[:cursor] have been 
+    drawn this round. Drawing is O(1): keys removed since are skipped when they come up, and new keys 
+    go to a random spot in the undrawn part"""
+    __slots__ = ("order", "cursor", "_keys", "_Random", "_last")
+
+    def __init__(self, Random=rand):
+        self.order = []
+        self.cursor = 0
+        self._keys = set() #of order, for sync()
+        self._Random = Random
+        self._last = None #key drawn last, so a new round doesn't start with it
+
+
+    def load(self, state):
+        """Takes 'state' (dict from toDict(), or empty) as the state"""
+        self.order = list(state.get("order", []))
+        self.cursor = min(state.get("cursor", 0), len(self.order))
+        self._keys = set(self.order)
+        self._last = self.order[self.cursor - 1] if self.cursor else None
+
+
+    def toDict(self):
+        return {"order": self.order, "cursor": self.cursor}
+
+
+    def sync(self, keys):
+        """Adds any of 'keys' (iterable) not in the bag yet, e.g. after loading an older state"""
+        for key in keys:
+            self.add(key)
+
+
+    def add(self, key):
+        """Puts 'key' somewhere random in the undrawn part of this round"""
+        if key in self._keys:
+            return #removed and added back within a round, it keeps its old spot
+        self.order.append(key)
+        self._keys.add(key)
+        j = self._Random.randint(self.cursor, len(self.order) - 1)
+        self.order[-1], self.order[j] = self.order[j], self.order[-1]
+
+
+    def draw(self, is_live):
+        """Returns the next key for which 'is_live'(key) is True, None if there are none at all"""
+        for _ in range(2): #this round, then a fresh one
+            while self.cursor < len(self.order):
+                key = self.order[self.cursor]
+                self.cursor += 1
+                if is_live(key):
+                    self._last = key
+                    return key
+            self._reshuffle(is_live)
+        return None
+
+
+    def _reshuffle(self, is_live):
+        self.order = [key for key in self.order if is_live(key)] #the removed ones are dropped for good here
+        self._keys = set(self.order)
+        self._Random.shuffle(self.order)
+        self.cursor = 0
+        if len(self.order) > 1 and self.order[0] == self._last: #no repeat across the rounds either
+            j = self._Random.randint(1, len(self.order) - 1)
+            self.order[0], self.order[j] = self.order[j], self.order[0]
+        Logger.info("Starting a new round of %s", len(self.order))
@@ -0,0 +1,248 @@
+"""
+In-memory full text search over song titles and notes, kept up to date by h_store.SongStore
+"""
+import re
+import math
+import bisect
+import heapq
+import logging
+
+Logger = logging.getLogger( __name__)
+
+TOKEN_REGEX = re.compile(r"\w+")
+RATING_FILTER_REGEX = re.compile(r"^rating(<=|>=|<|>|=)(\d+(?:\.\d+)?)$")
+TITLE_WEIGHT = 3 #a term in the title counts this many times a term in the notes
+NOTES_WEIGHT = 1
+PREFIX_MAX_TOKENS = 64 #a prefix term matches at most this many tokens (the first in order), so e.g. 'a*' stays cheap
+
+
+def _tokenize(text):
+    """Returns list of the lowercase word tokens of 'text' (str)"""
+    return TOKEN_REGEX.findall(text.lower())
+
+
+
+class SearchQuery:
+    """A parsed search: word 'terms' (all have to match), 'prefixes' (a word starting with each has to match),
+    and a rating range from 'rating_min' to 'rating_max'. Parsed from e.g. 'devil soldier* rating>=7'"""
+    __slots__ = ("terms", "prefixes", "rating_min", "rating_max", "min_inclusive", "max_inclusive")
+
+    def __init__(self, text):
+        self.terms = []
+        self.prefixes = []
+        self.rating_min, self.min_inclusive = float("-inf"), True
+        self.rating_max, self.max_inclusive = float("inf"), True
+
+        for word in text.lower().split():
+            match = RATING_FILTER_REGEX.match(word)
+            if match:
+                op, value = match.group(1), float(match.group(2))
+                if op in (">", ">=", "="):
+                    self.rating_min, self.min_inclusive = value, op != ">"
+                if op in ("<", "<=", "="):
+                    self.rating_max, self.max_inclusive = value, op != "<"
+            elif word.endswith("*"):
+                self.prefixes.extend(_tokenize(word))
+            else:
+                self.terms.extend(_tokenize(word))
+
+
+    def hasRatingFilter(self):
+        return self.rating_min != float("-inf") or self.rating_max != float("inf")
+
+
+    def isEmpty(self):
+        return not self.terms and not self.prefixes and not self.hasRatingFilter()
+
+
+    def ratingMatches(self, rating):
+        """Returns bool, whether 'rating' (number) is in the range"""
+        above = rating >= self.rating_min if self.min_inclusive else rating > self.rating_min
+        below = rating <= self.rating_max if self.max_inclusive else rating < self.rating_max
+        return above and below
+
+
+
+class SearchIndex:
+    """Inverted index of tokens (from title and notes) to the keys of the songs having them. Songs are
+    added, updated and removed one at a time, so keeping it up to date costs the size of the song.
+    The tokens are also kept sorted, for prefix terms, the songs sorted by rating, for rating filters, and
+    each token's songs sorted best first, so a one word search takes its top songs without scoring the rest"""
+
+    def __init__(self):
+        self._postings = {} #token: {key: weight}
+        self._ranked = {} #token: list of (-weight, -rating, key), sorted, so the best songs having the token come first
+        self._tokens = [] #every token in _postings, sorted
+        self._song_tokens = {} #key: tuple of the song's tokens, for removing it
+        self._ratings = {} #key: rating
+        self._by_rating = [] #(rating, key), sorted
+
+
+    def __len__(self):
+        return len(self._ratings)
+
+
+    def add(self, key, song):
+        """Indexes 'song' (h_store.Song) under 'key' (str, its video ID)"""
+        self._index(key, song, bisect.insort)
+
+
+    def addMany(self, items):
+        """Indexes every (key, song) of 'items' (iterable), sorting the lists once at the end rather than per song"""
+        for key, song in items:
+            self._index(key, song, list.append)
+        self._tokens.sort()
+        self._by_rating.sort()
+        for ranked in self._ranked.values():
+            ranked.sort()
+
+
+    def _index(self, key, song, insert):
+        """Indexes 'song' under 'key', putting entries in the sorted lists with 'insert' (function(list, item))"""
+        weights = {}
+        for token in _tokenize(song.title):
+            weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+        for token in _tokenize(song.notes):
+            weights[token] = weights.get(token, 0) + NOTES_WEIGHT
+
+        for token, weight in weights.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                self._ranked[token] = []
+                insert(self._tokens, token)
+            posting[key] = weight
+            insert(self._ranked[token], (-weight, -song.rating, key))
+        self._song_tokens[key] = tuple(weights)
+        self._ratings[key] = song.rating
+        insert(self._by_rating, (song.rating, key))
+
+
+    def remove(self, key):
+        """Takes the song of 'key' out of the index, if it is in it"""
+        tokens = self._song_tokens.pop(key, None)
+        if tokens is None:
+            return
+        rating = self._ratings.pop(key)
+        for token in tokens:
+            posting = self._postings[token]
+            ranked = self._ranked[token]
+            del ranked[bisect.bisect_left(ranked, (-posting.pop(key), -rating, key))]
+            if not posting:
+                del self._postings[token]
+                del self._ranked[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+        del self._by_rating[bisect.bisect_left(self._by_rating, (rating, key))]
+
+
+    def update(self, key, song):
+        self.remove(key)
+        self.add(key, song)
+
+
+    def _prefixTokens(self, prefix):
+        """Returns list of the tokens starting with 'prefix', at most PREFIX_MAX_TOKENS of them"""
+        i = bisect.bisect_left(self._tokens, prefix)
+        end = min(i + PREFIX_MAX_TOKENS, len(self._tokens))
+        tokens = []
+        while i < end and self._tokens[i].startswith(prefix):
+            tokens.append(self._tokens[i])
+            i += 1
+        return tokens
+
+
+    def _ratingBounds(self, Query):
+        """Returns (int, int), the slice of _by_rating in the rating range of 'Query'"""
+        lo = bisect.bisect_left(self._by_rating, (Query.rating_min,)) if Query.rating_min != float("-inf") else 0
+        hi = bisect.bisect_right(self._by_rating, (Query.rating_max, "\U0010ffff")) if Query.rating_max != float("inf") else len(self._by_rating)
+        #only the ends of the range can be on an exclusive bound
+        while lo < hi and not Query.ratingMatches(self._by_rating[lo][0]):
+            lo += 1
+        while hi > lo and not Query.ratingMatches(self._by_rating[hi - 1][0]):
+            hi -= 1
+        return lo, hi
+
+
+    def _ratingRange(self, Query, limit):
+        """Returns (list, int) of the keys of the 'limit' highest rated songs in the rating range of 'Query',
+        and how many are in the range"""
+        lo, hi = self._ratingBounds(Query)
+        return [key for _rating, key in reversed(self._by_rating[max(lo, hi - limit):hi])], hi - lo
+
+
+    def search(self, text, limit=10):
+        """Returns (list, int) of the keys of the best 'limit' matches of 'text' (see SearchQuery),
+        best first, and how many matched in all. Songs score the sum of their term weights, each
+        scaled by how rare the term is (idf), ties go to the higher rating"""
+        Query = SearchQuery(text)
+        if Query.isEmpty():
+            return [], 0
+        if not Query.terms and not Query.prefixes:
+            return self._ratingRange(Query, limit)
+
+        #each term is a group of tokens, any of which matches it: the term itself or the tokens of a prefix
+        groups = [[term] if term in self._postings else [] for term in Query.terms]
+        groups += [self._prefixTokens(prefix) for prefix in Query.prefixes]
+        if not all(groups):
+            return [], 0
+        matching = [self._postings[tokens[0]] if len(tokens) == 1 else set().union(*map(self._postings.get, tokens))
+                    for tokens in groups] #keys having each group
+        sizes = [len(keys) for keys in matching]
+
+        #intersect over the keys first, starting from the rarest, so only the songs matching everything get scored
+        order = sorted(range(len(groups)), key=sizes.__getitem__)
+        keys = matching[order[0]]
+        for i in order[1:]:
+            keys = set(filter(matching[i].__contains__, keys))
+            if not keys:
+                return [], 0
+        if Query.hasRatingFilter():
+            keys = self._filterRating(Query, keys)
+        if not keys:
+            return [], 0
+
+        if len(groups) == 1:
+            #one group scores by weight alone, so its best songs are the first of its tokens' ranked lists
+            found = []
+            seen = set()
+            for _weight, _rating, key in heapq.merge(*map(self._ranked.get, groups[0])):
+                if len(found) >= limit:
+                    break
+                if key not in seen and key in keys:
+                    seen.add(key)
+                    found.append(key)
+            return found, len(keys)
+
+        num_songs = len(self._ratings)
+        scores = dict.fromkeys(keys, 0.0)
+        for tokens, size in zip(groups, sizes):
+            idf = math.log(1 + num_songs / size)
+            if len(tokens) == 1:
+                posting = self._postings[tokens[0]]
+                scores = {key: score + posting[key] * idf for key, score in scores.items()}
+            else:
+                postings = [self._postings[token] for token in tokens]
+                scores = {key: score + max(posting.get(key, 0) for posting in postings) * idf for key, score in scores.items()}
+
+        #the cut off score first, then only the songs tied on it need breaking by rating
+        top_scores = heapq.nlargest(limit, scores.values())
+        if not top_scores:
+            return [], len(scores)
+        cutoff = top_scores[-1]
+        above = [key for key, score in scores.items() if score > cutoff]
+        above.sort(key=lambda key: (scores[key], self._ratings[key]), reverse=True)
+        tied = [key for key, score in scores.items() if score == cutoff]
+        return above + heapq.nlargest(limit - len(above), tied, key=self._ratings.__getitem__), len(scores)
+
+
+    def _filterRating(self, Query, keys):
+        """Returns set of the 'keys' in the rating range of 'Query', going through whichever of the two is smaller"""
+        lo, hi = self._ratingBounds(Query)
+        if lo == hi:
+            return set()
+        if hi - lo < len(keys):
+            in_range = {key for _rating, key in self._by_rating[lo:hi]}
+            return set(filter(in_range.__contains__, keys))
+        lowest, highest = self._by_rating[lo][0], self._by_rating[hi - 1][0] #the range, inclusive, on actual ratings
+        ratings = self._ratings
+        return {key for key in keys if lowest <= ratings[key] <= highest}
@@ -0,0 +1,471 @@
+"""
+In-memory song and template stores. The data file is loaded once, reads are served from memory,
+and every mutation is passed on to a persister from h_persist to be written back
+"""
+import os
+import json
+import random as rand
+import asyncio
+import logging
+import dataclasses
+
+import h_watch
+import h_random
+import h_search
+import h_persist
+import h_template
+
+Logger = logging.getLogger( __name__)
+
+SCHEMA_VERSION = 2 #of the data file. 1: notes a str or list of words, rating a str or number. 2: a str and a number
+
+
+
+class NotLoadedError(RuntimeError):
+    """A mutation of the stores before the database was loaded, which would write an empty database over it"""
+
+
+@dataclasses.dataclass(frozen=True)
+class Song:
+    """A song of the database. Immutable, so it can be handed out of the store without copying, 
+    and normalised when made with fromDict(): 'notes' is always a str and 'rating' always a number"""
+    __slots__ = ("title", "url", "rating", "notes")
+    title: str
+    url: str
+    rating: float #int if it is a whole number, it reads nicer
+    notes: str
+
+    @classmethod
+    def fromDict(cls, raw_song):
+        """Returns Song of 'raw_song' (dict laid out like in the data file, of any schema version).
+        ValueError if its rating isn't a number from 0 to 10"""
+        return cls(str(raw_song["title"]), str(raw_song["url"]), _normalizeRating(raw_song["rating"]), 
+                   _normalizeNotes(raw_song.get("notes", "")))
+
+
+    def toDict(self):
+        """Returns dict laid out like in the data file"""
+        return {"title": self.title, "url": self.url, "rating": self.rating, "notes": self.notes}
+
+
+
+def _normalizeRating(raw_rating):
+    """Returns float of 'raw_rating' (str or number), or int if it is a whole number. 
+    ValueError if it isn't a number from 0 to 10"""
+    try:
+        rating = float(raw_rating)
+    except TypeError:
+        raise ValueError(f"rating {raw_rating!r} isn't a number")
+    if not 0 <= rating <= 10: #also catches nan
+        raise ValueError(f"rating {raw_rating!r} isn't from 0 to 10")
+    return int(rating) if rating.is_integer() else rating
+
+
+def _salvageRating(raw_rating):
+    """Returns int or float, 'raw_rating' (anything) made into a rating from 0 to 10 as best it can: 
+    clamped if it is a number out of range, 0 if it isn't a number at all"""
+    try:
+        rating = float(raw_rating)
+    except (TypeError, ValueError):
+        return 0
+    if rating != rating: #nan
+        return 0
+    rating = min(max(rating, 0.0), 10.0)
+    return int(rating) if rating.is_integer() else rating
+
+
+def _loadSong(raw_song):
+    """Returns Song of 'raw_song' like Song.fromDict(), but never refuses one over its rating. Older
+    versions of .update stored any rating, so a bad one is salvaged and the original kept in the notes"""
+    try:
+        return Song.fromDict(raw_song)
+    except ValueError:
+        rating = _salvageRating(raw_song["rating"])
+        notes = _normalizeNotes(raw_song.get("notes", ""))
+        notes = (notes + " " if notes else "") + f"(rating was {raw_song['rating']!r})"
+        Logger.warning("Song '%s' has rating %r, which isn't a number from 0 to 10, loading it as %s", 
+                       raw_song.get("title"), raw_song["rating"], rating)
+        return Song(str(raw_song["title"]), str(raw_song["url"]), rating, notes)
+
+
+def _normalizeNotes(raw_notes):
+    """Returns str of 'raw_notes', which older data and the .update command have as a list of words"""
+    if raw_notes is None:
+        return ""
+    if isinstance(raw_notes, str):
+        return raw_notes
+    return " ".join(str(note) for note in raw_notes)
+
+
+
+class SongStore:
+    """The songs of the database (Song records), in order. Kept as video IDs in order plus a dict of 
+    video ID: Song, so existence checks, lookups and updates by url don't depend on the number of songs"""
+
+    def __init__(self, record, check=None):
+        self._order = [] #video IDs, in order
+        self._by_id = {} #video ID: Song
+        self._record = record #function(op, payload) called after each mutation
+        self._check = check or (lambda: None) #function called before each mutation, raising if it isn't allowed
+        self.version = 0 #goes up on every change, for things built from the songs to know they are stale
+        self._Alias = None #h_random.AliasTable over _order, for weightedRandom()
+        self._alias_for = None #(version, exponent) _Alias was built for
+        self.Bag = h_random.ShuffleBag() #of video IDs, for nextInRotation(). Its state is kept by DataStore
+        self.Index = h_search.SearchIndex() #of video IDs, for search()
+
+
+    def _load(self, songs):
+        """'songs' is a list of Song. A song whose video is already in it is dropped"""
+        order = []
+        by_id = {}
+        for song in songs:
+            key = h_persist._songKey(song.url)
+            if key in by_id:
+                Logger.warning("'%s' is in the database more than once, dropping the later one", song.url)
+                continue
+            order.append(key)
+            by_id[key] = song
+        self._order, self._by_id = order, by_id
+        self.Index = h_search.SearchIndex()
+        self.Index.addMany((key, by_id[key]) for key in order)
+        self.version += 1
+
+
+    def __len__(self):
+        return len(self._order)
+
+
+    def __contains__(self, url):
+        return h_persist._songKey(url) in self._by_id
+
+
+    def all(self):
+        """Returns list of Song, in order"""
+        return [self._by_id[key] for key in self._order]
+
+
+    def get(self, index):
+        """Returns the Song of 'index' (int)"""
+        return self._by_id[self._order[index]]
+
+
+    def random(self):
+        """Returns a random Song"""
+        return self._by_id[rand.choice(self._order)]
+
+
+    def weightedRandom(self, exponent=h_random.RATING_WEIGHT_EXPONENT):
+        """Returns a random Song, higher rated ones more likely (see h_random._ratingWeight()). 
+        O(1), bar rebuilding the alias table the first time after the songs changed"""
+        if self._alias_for != (self.version, exponent):
+            weights = [h_random._ratingWeight(self._by_id[key].rating, exponent) for key in self._order]
+            self._Alias = h_random.AliasTable(weights)
+            self._alias_for = (self.version, exponent)
+        return self._by_id[self._order[self._Alias.pick()]]
+
+
+    def nextInRotation(self):
+        """Returns the next Song of the shuffle bag, so every song comes up once before any comes up again. 
+        IndexError if there are no songs"""
+        key = self.Bag.draw(self._by_id.__contains__)
+        if key is None:
+            raise IndexError("no songs to draw from")
+        return self._by_id[key]
+
+
+    def search(self, text, limit=10):
+        """Returns (list, int) of the best 'limit' Songs matching 'text' (see h_search.SearchQuery), 
+        and how many matched in all"""
+        keys, num_matches = self.Index.search(text, limit)
+        return [self._by_id[key] for key in keys], num_matches
+
+
+    def find(self, url):
+        """Returns the Song with the same video as 'url' (str), None if it doesn't exist"""
+        return self._by_id.get(h_persist._songKey(url))
+
+
+    def add(self, song):
+        """Returns bool. True if 'song' (Song) was added, False if its video is already in the store"""
+        self._check()
+        key = h_persist._songKey(song.url)
+        if key in self._by_id:
+            return False
+        self._order.append(key)
+        self._by_id[key] = song
+        self.Bag.add(key)
+        self.Index.add(key, song)
+        self.version += 1
+        self._record(h_persist.ADD_SONG, {"song": song.toDict()})
+        return True
+
+
+    def update(self, url, rating, notes):
+        """Returns bool. True if the song with 'url' (str) existed and had its rating and notes replaced.
+        'rating' and 'notes' are normalised like in Song.fromDict()"""
+        self._check()
+        key = h_persist._songKey(url)
+        song = self._by_id.get(key)
+        if song is None:
+            return False
+        song = dataclasses.replace(song, rating=_normalizeRating(rating), notes=_normalizeNotes(notes))
+        self._by_id[key] = song
+        self.Index.update(key, song)
+        self.version += 1
+        self._record(h_persist.UPDATE_SONG, {"url": song.url, "rating": song.rating, "notes": song.notes})
+        return True
+
+
+    def remove(self, index):
+        """Returns the removed Song of 'index' (int)"""
+        self._check()
+        key = self._order.pop(index)
+        song = self._by_id.pop(key)
+        self.Index.remove(key)
+        self.version += 1
+        self._record(h_persist.REMOVE_SONG, {"url": song.url})
+        return song
+
+
+
+class TemplateStore:
+    """The templates of the database, in order. Kept as hashes in order plus a dict of hash: 
+    h_template.CompiledTemplate, so each template is compiled once (when added or loaded), 
+    and existence checks are constant time"""
+
+    def __init__(self, record, check=None):
+        self._order = [] #template hashes, in order
+        self._by_hash = {} #template hash: h_template.CompiledTemplate
+        self._record = record #function(op, payload) called after each mutation
+        self._check = check or (lambda: None) #function called before each mutation, raising if it isn't allowed
+
+
+    def _load(self, templates):
+        """'templates' is a list of str. A template that is already in it is dropped"""
+        order = []
+        by_hash = {}
+        for template in templates:
+            key = h_persist._templateHash(template)
+            if key in by_hash:
+                Logger.warning("Template '%s' is in the database more than once, dropping the later one", template)
+                continue
+            Compiled = h_template.CompiledTemplate(template)
+            if Compiled.unknown:
+                Logger.warning("Template '%s' has unknown codes %s, they are posted as they are", template, Compiled.unknown)
+            order.append(key)
+            by_hash[key] = Compiled
+        self._order, self._by_hash = order, by_hash
+
+
+    def __len__(self):
+        return len(self._order)
+
+
+    def __contains__(self, template):
+        return h_persist._templateHash(template) in self._by_hash
+
+
+    def all(self):
+        """Returns list of template str's, in order"""
+        return [self._by_hash[key].text for key in self._order]
+
+
+    def get(self, index):
+        """Returns the template str of 'index' (int)"""
+        return self._by_hash[self._order[index]].text
+
+
+    def random(self):
+        """Returns a random h_template.CompiledTemplate"""
+        return self._by_hash[rand.choice(self._order)]
+
+
+    def add(self, template):
+        """Returns bool. True if 'template' (str) was added, False if it already exists"""
+        self._check()
+        key = h_persist._templateHash(template)
+        if key in self._by_hash:
+            return False
+        self._order.append(key)
+        self._by_hash[key] = h_template.CompiledTemplate(template)
+        self._record(h_persist.ADD_TEMPLATE, {"template": template})
+        return True
+
+
+    def remove(self, index):
+        """Returns the removed template str of 'index' (int)"""
+        self._check()
+        template = self._by_hash.pop(self._order.pop(index)).text
+        self._record(h_persist.REMOVE_TEMPLATE, {"template": template})
+        return template
+
+
+
+class DataStore:
+    """Both stores of the database, plus the persister writing them back. 'backend' is "json" for 
+    the data file at 'path', "journal" for it plus a journal of the changes, or "sqlite" for the database 
+    at 'db_path' (migrated from 'path' the first time)"""
+
+    def __init__(self, path, indent=4, write_delay=h_persist.WRITE_BEHIND_DELAY, 
+                 group_window=h_persist.GROUP_COMMIT_WINDOW, backend="json", db_path=None, rotation_path=None):
+        self.backend = backend
+        self.rotation_path = rotation_path #where the shuffle bag of songs.nextInRotation() is kept, None not to keep it
+        if backend == "sqlite":
+            self.path = db_path
+            self.persister = h_persist.SqlitePersister(db_path, path, write_delay, group_window)
+        elif backend == "journal":
+            self.path = path
+            self.persister = h_persist.JournalPersister(path, self.toDict, indent, write_delay, group_window)
+        elif backend == "json":
+            self.path = path
+            self.persister = h_persist.JsonPersister(path, self.toDict, indent, write_delay, group_window)
+        else:
+            raise ValueError(f"unknown data backend '{backend}', has to be 'json', 'journal' or 'sqlite'")
+        self.songs = SongStore(self._record, self._checkLoaded)
+        self.templates = TemplateStore(self._record, self._checkLoaded)
+        self.is_loaded = False
+        self.persister.is_writable = False #until loaded, so an empty store is never written over the database
+        self.Watcher = None #h_watch.FileWatcher, once watch()'ed
+        self._Reloading = None #asyncio.Task of _reloadAsync()
+
+
+    def _record(self, op, payload):
+        self.persister.record(op, payload)
+
+
+    def _checkLoaded(self):
+        if not self.is_loaded:
+            raise NotLoadedError(f"'{self.path}' isn't loaded, not changing it")
+
+
+    def load(self):
+        """Loads the database into memory, the only time it is read. Data of an older schema version 
+        (or hand edited into an odd shape) is normalised, and written back straight away. 
+        Blocking, inside the event loop use loadAsync()"""
+        data = self.persister.load()
+        if self._apply(data):
+            self.persister.rewrite(self.toDict())
+        self._applyRotation(self._readRotation())
+
+
+    async def loadAsync(self):
+        """load() with the reading, parsing and any writing back done on the persister's I/O thread"""
+        data = await self.persister.loadAsync()
+        if self._apply(data):
+            await self.persister.run(self.persister.rewrite, self.toDict())
+        self._applyRotation(await self.persister.run(self._readRotation))
+
+
+    def _apply(self, data):
+        """Puts 'data' (dict laid out like the data file) into the stores. Returns bool, True if it 
+        has to be written back normalised"""
+        songs = [_loadSong(raw_song) for raw_song in data["songs"]] #all before loading anything, for reload()
+        templates = data["templates"]
+        if not all(isinstance(template, str) for template in templates):
+            raise ValueError("templates have to be strings")
+        self.songs._load(songs)
+        self.templates._load(templates)
+        self.is_loaded = True
+        self.persister.is_writable = True
+        Logger.info("Loaded '%s': %s songs, %s templates", self.path, len(self.songs), len(self.templates))
+
+        data_version = data.get("schema_version", 1)
+        if data_version != SCHEMA_VERSION or data != self.toDict():
+            Logger.info("Normalising '%s' from schema version %s to %s", self.path, data_version, SCHEMA_VERSION)
+            return True
+        return False
+
+
+    def _readRotation(self):
+        """Returns dict of the saved shuffle bag state, empty if there is none (or it's unreadable). Blocking"""
+        if self.rotation_path is None or not os.path.exists(self.rotation_path):
+            return {}
+        try:
+            with open(self.rotation_path, "r", encoding="utf-8") as read_file:
+                return json.load(read_file)
+        except (OSError, ValueError) as e:
+            Logger.warning("Couldn't read '%s' (%r), starting a new rotation", self.rotation_path, e)
+            return {}
+
+
+    def _applyRotation(self, state):
+        self.songs.Bag.load(state)
+        self.songs.Bag.sync(self.songs._order) #songs added while it wasn't saved, or all of them the first time
+
+
+    def saveRotation(self):
+        """Saves the shuffle bag state after a draw, on the persister's I/O thread if there is an event loop"""
+        if self.rotation_path is None:
+            return
+        text = json.dumps(self.songs.Bag.toDict())
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            h_persist._atomicWrite(self.rotation_path, text)
+            return
+        Saving = asyncio.ensure_future(self.persister.run(h_persist._atomicWrite, self.rotation_path, text))
+        Saving.add_done_callback(self._rotationSaved)
+
+
+    def _rotationSaved(self, Saving):
+        if Saving.exception() is not None:
+            Logger.error("Saving '%s' failed", self.rotation_path, exc_info=Saving.exception())
+
+
+    def watch(self):
+        """Starts reloading the data file whenever it is changed from outside the Bot (hand edits), 
+        from inside the event loop. Only the "json" backend, the others aren't meant to be hand edited"""
+        if self.backend != "json":
+            Logger.info("Not watching '%s', hand edits aren't picked up with the '%s' backend", self.path, self.backend)
+            return
+        if self.Watcher is None:
+            self.Watcher = h_watch.FileWatcher(self.path, self.reload)
+            self.persister.on_write = self.Watcher.remember
+            self.Watcher.start()
+
+
+    def reload(self):
+        """Loads the data file again (in the background) after it was changed from outside the Bot. The 
+        file wins over changes not written yet, and a file that doesn't parse leaves memory as it was"""
+        self._Reloading = asyncio.get_running_loop().create_task(self._reloadAsync())
+
+
+    async def _reloadAsync(self):
+        if self.persister.is_dirty:
+            Logger.warning("'%s' was changed from outside with changes not written yet, the file wins", self.path)
+            self.persister.discard()
+        try:
+            await self.loadAsync()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            Logger.warning("Couldn't reload '%s' (%r), keeping what is in memory", self.path, e)
+
+
+    def toDict(self):
+        """Returns dict of the whole database, laid out like the data file"""
+        return {"schema_version": SCHEMA_VERSION, "songs": [song.toDict() for song in self.songs.all()], 
+                "templates": self.templates.all()}
+
+
+    async def commit(self):
+        """Returns once every mutation so far is safely on disk, e.g. before a command replies"""
+        await self.persister.commit()
+
+
+    def flush(self):
+        """Writes any mutations not written yet"""
+        self.persister.flush()
+
+
+    def close(self):
+        """Writes any mutations not written yet and closes the persister, on shutdown. Blocking, 
+        inside the event loop use closeAsync()"""
+        if self.Watcher is not None:
+            self.Watcher.stop()
+        self.persister.close()
+
+
+    async def closeAsync(self):
+        """close() with the writing done on the persister's I/O thread"""
+        if self.Watcher is not None:
+            self.Watcher.stop()
+        await self.persister.closeAsync()
@@ -0,0 +1,63 @@
+"""
+Song templates, compiled once into literal and placeholder segments so that posting is a single join
+"""
+import re
+import logging
+
+Logger = logging.getLogger( __name__)
+
+PLACEHOLDER_REGEX = re.compile(r"\{(\w+)\}")
+
+#placeholder code: function(song) returning the str it is replaced with. A new code only needs adding here
+FIELDS = {
+    "title": lambda song: song.title,
+    "url": lambda song: song.url,
+    "rating": lambda song: str(song.rating),
+    "notes": lambda song: song.notes,
+}
+REQUIRED_FIELDS = ("title", "rating", "url")
+
+
+
+class CompiledTemplate:
+    """A template str ('text') split into literal and placeholder segments. Unknown placeholders
+    (like '{titel}') are found here, once, and left in the output as they are"""
+    __slots__ = ("text", "fields", "unknown", "_parts", "_slots")
+
+    def __init__(self, text):
+        self.text = text
+        self.fields = [] #known placeholder codes in the template, in order
+        self.unknown = [] #unknown placeholder codes
+        self._parts = [] #literal str's, with "" where a placeholder goes
+        self._slots = [] #(index in _parts, FIELDS function) of each placeholder
+
+        #split() with a group alternates literal, code, literal, code, ..., literal
+        for i, piece in enumerate(PLACEHOLDER_REGEX.split(text)):
+            if i % 2 == 0:
+                if piece:
+                    self._parts.append(piece)
+            elif piece in FIELDS:
+                self.fields.append(piece)
+                self._slots.append((len(self._parts), FIELDS[piece]))
+                self._parts.append("")
+            else:
+                self.unknown.append(piece)
+                self._parts.append("{" + piece + "}")
+
+
+    def missing(self):
+        """Returns list of the REQUIRED_FIELDS codes not in the template"""
+        return [field for field in REQUIRED_FIELDS if field not in self.fields]
+
+
+    def isValid(self):
+        """Returns bool, True if it has every required code and no unknown ones"""
+        return not self.unknown and not self.missing()
+
+
+    def render(self, song):
+        """Returns str of the template filled in with 'song' (h_store.Song)"""
+        parts = self._parts.copy()
+        for index, get in self._slots:
+            parts[index] = get(song)
+        return "".join(parts)
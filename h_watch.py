@@ -0,0 +1,156 @@
+"""
+Watching the data file for hand edits, with inotify on Linux and mtime/size polling everywhere else
+"""
+import os
+import sys
+import ctypes
+import ctypes.util
+import struct
+import asyncio
+import logging
+
+Logger = logging.getLogger( __name__)
+
+DEBOUNCE_DELAY = 0.5 #seconds the file has to stay the same before a change is reported, editors save in several steps
+POLL_INTERVAL = 2.0 #seconds between checks when inotify isn't available
+
+#from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII") #wd, mask, cookie, len, followed by len bytes of name
+INOTIFY_READ_BYTES = 64 * 1024
+
+
+def _signature(path):
+    """Returns tuple (mtime_ns, size, inode) of the file at 'path', None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _inotifyWatch(folder):
+    """Returns int of a non-blocking inotify fd watching 'folder', None if inotify isn't available.
+    The folder is watched rather than the file, since atomic writes replace the file (and its inode)"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    if libc.inotify_add_watch(fd, os.fsencode(folder), mask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+
+class FileWatcher:
+    """Calls 'on_change' (function) once the file at 'path' has changed and then stayed the same for
+    'debounce' seconds, so a burst of events is one call. Our own writes are told apart by calling
+    remember() after each of them: a change is only reported if the file's (mtime, size, inode)
+    differs from what was last remembered"""
+
+    def __init__(self, path, on_change, debounce=DEBOUNCE_DELAY, poll_interval=POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self.mode = None #"inotify" or "poll" once started
+        self.num_changes = 0
+        self._name = os.fsencode(os.path.basename(self.path))
+        self._signature = None
+        self._fd = None
+        self._Poller = None #asyncio.Task of _poll()
+        self._Timer = None #asyncio.TimerHandle of the pending _settle()
+
+
+    def remember(self, signature=None):
+        """Takes 'signature' (tuple like _signature()'s, of our own write as it was made) as known, so that
+        write isn't reported as a change but an edit straight after it still is. None takes the file as it is now"""
+        self._signature = signature if signature is not None else _signature(self.path)
+
+
+    def start(self):
+        """Starts watching, from inside the event loop"""
+        self.remember()
+        Loop = asyncio.get_running_loop()
+        self._fd = _inotifyWatch(os.path.dirname(self.path))
+        if self._fd is not None:
+            Loop.add_reader(self._fd, self._readEvents)
+            self.mode = "inotify"
+        else:
+            self._Poller = Loop.create_task(self._poll())
+            self.mode = "poll"
+        Logger.info("Watching '%s' for changes (%s)", self.path, self.mode)
+
+
+    def stop(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._Poller is not None:
+            self._Poller.cancel()
+            self._Poller = None
+        if self._Timer is not None:
+            self._Timer.cancel()
+            self._Timer = None
+
+
+    def _readEvents(self):
+        try:
+            buffer = os.read(self._fd, INOTIFY_READ_BYTES)
+        except BlockingIOError:
+            return
+        offset = 0
+        is_relevant = False
+        while offset < len(buffer):
+            _wd, _mask, _cookie, name_len = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            is_relevant = is_relevant or name == self._name #the rest of the folder, like temp files, doesn't matter
+        if is_relevant:
+            self._debounce()
+
+
+    async def _poll(self):
+        last_seen = self._signature
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = _signature(self.path)
+            if signature != last_seen: #only when it moved since the last poll, or _settle() never gets to run
+                last_seen = signature
+                self._debounce()
+
+
+    def _debounce(self):
+        if self._Timer is not None:
+            self._Timer.cancel()
+        self._Timer = asyncio.get_running_loop().call_later(self.debounce, self._settle)
+
+
+    def _settle(self):
+        self._Timer = None
+        signature = _signature(self.path)
+        if signature is None or signature == self._signature:
+            return #deleted (mid save), or nothing changed since our own write
+        self._signature = signature
+        self.num_changes += 1
+        Logger.info("'%s' changed (change #%s)", self.path, self.num_changes)
+        try:
+            self.on_change()
+        except Exception:
+            Logger.exception("Handling the change of '%s' failed", self.path)
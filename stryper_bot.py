@@ -7,9 +7,9 @@ Created by Noah Lobbe, November 2023
 #standard python libraries
 import os
 import json
+import asyncio
 import aiohttp
 import datetime
-import random as rand
 import logging
 
 #denpendencies
@@ -20,7 +20,11 @@ from dotenv import load_dotenv
 
 
 #other files
+import h_enactment
 import h_functions
+import h_pages
+import h_store
+import h_template
 
 
 ###Constants
@@ -30,6 +34,17 @@ DAVE_MODE = True
 
 JSON_INDENTS = 4
 DATA_FILE = "data.json"
+DATA_BACKEND = "json" #or "journal" (see README), or "sqlite", which keeps the database in DATA_DB_FILE instead (migrated from DATA_FILE the first time)
+DATA_DB_FILE = "data.db"
+DATA_WRITE_DELAY = 2.0 #seconds, changes are written to DATA_FILE in the background this long after the first one
+DATA_GROUP_COMMIT_WINDOW = 0.05 #seconds, commands changing the data within this window share one write. None for one write each
+RANDOM_MODE = "rotation" #for .random and trigger. Rotation goes through every song once (in a shuffled order) before any repeats, 
+                         #"weighted" picks higher rated songs more often, "uniform" is plain random
+ROTATION_FILE = "rotation.json" #where the rotation is kept between restarts
+RATING_WEIGHT_EXPONENT = 2.0 #weight of a song is its rating to the power of this, e.g. with 2 a 10/10 comes up 4 times as often as a 5/10
+SEARCH_MAX_RESULTS = 10 #songs listed by .search
+ENACTMENT_FILE = "enactment.json" #today's enactment tracking, so it carries on after a restart
+DATA_WATCH = True #reload DATA_FILE when it is hand edited while the Bot runs ("json" backend only)
 
 # trigger stuff
 # Mon==0,...Sun==6 according to datetime.weekday() documentation. Tad messy for stringifying due to the conflict of strftime() and weekday()
@@ -42,11 +57,37 @@ TRIGGER_DAY_NUM =   DAYS_LEGEND[TRIGGER_DAY_STR]
 TRIGGER_SETUP_MSG = f"Deployment set for {TRIGGER_DAY_STR} @ {TRIGGER_TIME.strftime('%H:%M')}" 
 
 #bot setup
+class StryperBot(discord.ext.commands.Bot):
+    """discord.py Bot that also tidies up StryperBot's own resources when shutting down"""
+    async def close(self):
+        if PREWARM_TASK is not None:
+            PREWARM_TASK.cancel()
+        if ENACTMENT_TASK is not None:
+            ENACTMENT_TASK.cancel()
+        await h_functions._closeSession()
+        await h_functions.MetaCache.closeAsync()
+        await Store.closeAsync() #writes anything not written behind yet
+        await Tracker.closeAsync()
+        await super().close()
+
+
 BotIntents = discord.Intents.default()
 BotIntents.message_content = True 
-Bot = discord.ext.commands.Bot(command_prefix=".", intents=BotIntents)
+Bot = StryperBot(command_prefix=".", intents=BotIntents)
+
+Store = h_store.DataStore(DATA_FILE, indent=JSON_INDENTS, write_delay=DATA_WRITE_DELAY, 
+                          group_window=DATA_GROUP_COMMIT_WINDOW, backend=DATA_BACKEND, db_path=DATA_DB_FILE, 
+                          rotation_path=ROTATION_FILE) #loaded in on_ready()
+Tracker = h_enactment.EnactmentTracker(ENACTMENT_FILE, indent=JSON_INDENTS, write_delay=DATA_WRITE_DELAY) #loaded in on_ready()
 
 CHANNEL = None #the channel to post messages into
+PREWARM_TASK = None #asyncio.Task filling the youtube metadata cache, started in on_ready()
+ENACTMENT_QUEUE = None #asyncio.Queue of messages for Tracker (None to catch up), made in on_ready()
+ENACTMENT_TASK = None #asyncio.Task feeding Tracker from ENACTMENT_QUEUE
+ENACTMENT_IS_LIVE = False #True once Tracker has caught up and is following the channel, until a disconnect
+ENACTMENT_HELD = [] #messages that came in while not live, fed once the catch up before them has been
+ENACTMENT_HELD_MAX = 500 #past this the held messages are dropped, the catch up reads them from history instead
+ENACTMENT_HELD_DROPPED = False #True if held messages were dropped since the catch up last read history
 PRIVILEGED_MEMBERS = set() #wanted something immutable
 AUTHOR = None
 
@@ -123,12 +164,16 @@ async def _getChannel(debug_mode=True):
 
 ### Data file helper function(s)
 def _doesDataFileExist():
-    """Returns bool. True if already existed, and False if file had to be made"""
+    """Returns bool. True if already existed, and False if file had to be made. With the "sqlite" backend 
+    the database is made when it is loaded, so nothing is made here"""
+    if DATA_BACKEND == "sqlite":
+        return os.path.exists(DATA_DB_FILE)
     if not os.path.exists(DATA_FILE):
         logging.info("Making '%s'", DATA_FILE)
 
         with open(DATA_FILE, "w+") as new_file:
             data = {
+                "schema_version": h_store.SCHEMA_VERSION,
                 "songs": [], 
                 "templates":[]
                 }
@@ -138,96 +183,57 @@ def _doesDataFileExist():
 
 
 def _getData():
-    """Returns JSON object of whole file"""
-    with open(DATA_FILE, "r") as read_file:
-        return json.load(read_file)
-
-def _writeData(new_data):
-    with open(DATA_FILE, "w") as write_file:
-        json.dump(new_data, write_file, indent=JSON_INDENTS)
+    """Returns dict of the whole database (from memory, laid out like the data file)"""
+    return Store.toDict()
 
 
 ### Templates helper functions
 def _getTemplates():
     """Returns a list of templates"""
-    with open(DATA_FILE, "r") as read_file:
-        return json.load(read_file)["templates"]
+    return Store.templates.all()
     
 
 def _writeTemplates(new_template):
     """Writes templates to database"""
-    current_database = _getData()
-    current_templates_list = current_database["templates"]
-
-    #with open(DATA_FILE, "w") as write_file:
-    current_templates_list.append(new_template)
-    _writeData(current_database)
-
-        #json.dump(current_database, write_file, indent=JSON_INDENTS)
+    Store.templates.add(new_template)
 
     
 def _randomTemplate():
-    """Returns str"""
-    templates = _getTemplates()
-    if len(templates) > 0:
-        return rand.choice(_getTemplates())
-    else:
+    """Returns h_template.CompiledTemplate"""
+    if len(Store.templates) == 0:
         default = "***Hello everybody and WELCOME to Stryper Saturday!!!*** \nToday is the amazing song *{title}*, with a rating of {rating}/10: {url}" 
+        if not Store.is_loaded:
+            return h_template.CompiledTemplate(default) #nowhere to keep it
         _writeTemplates(default)
-        return default
+    return Store.templates.random()
 
 
 def _insertSongToTemplate(template, song):
-    """Returns a str which has made o"""
-
-    replacements = [
-        ("{title}", song["title"]),
-        ("{url}",song["url"]),
-        ("{rating}", str(song['rating'])), #has to be a str for .replace(...)
-        ("{notes}", song["notes"])
-    ]
-
-    new_string = template
-    for replacement in replacements:
-        new_string = new_string.replace(replacement[0], replacement[1])
-    return new_string
+    """Returns a str of the h_template.CompiledTemplate 'template' filled in with 'song'"""
+    return template.render(song)
 
         
 def _isValidTemplate(raw_template):
-    """Returns bool"""
-    has_title = "{title}" in raw_template
-    has_rating = "{rating}" in raw_template
-    has_url = "{url}" in raw_template
+    """Returns bool, (bool, bool, bool) of it having the title, rating and url codes, and list of unknown codes"""
+    Compiled = h_template.CompiledTemplate(raw_template)
+    has_title = "title" in Compiled.fields
+    has_rating = "rating" in Compiled.fields
+    has_url = "url" in Compiled.fields
 
-    return (has_title and has_rating and has_url), (has_title, has_rating, has_url)
+    return Compiled.isValid(), (has_title, has_rating, has_url), Compiled.unknown
 
 
-def _doesTemplateExist(templates_list, template):
-    """Returns (bool, int). True if already exists, int of index if it exists, 0 otherwise."""
-    for i, t in enumerate(templates_list):
-        if (t == template):
-            logging.info("Template exists in database!")
-            return True, i
-    return False, 0
+def _templateLine(index):
+    """Returns str of the template of 'index' for listing, with its index (for .remove_t)"""
+    return f"{index}: {Store.templates.get(index)}"
 
 
 def _addTemplate(new_template):
     """Returns bool. True if successful, False otherwise"""
-    
-    current_data_file = _getData()
-    current_templates_list = current_data_file["templates"]
-
-    template_already_exists, index = _doesTemplateExist(current_templates_list, new_template)
-    if not template_already_exists:
-        
-        current_data_file["templates"].append(new_template)
-
-        _writeData(current_data_file)
-        #with open(DATA_FILE, "w") as write_file:    
-            #json.dump(current_data_file, write_file, indent=JSON_INDENTS)
-        
-        return True
-    return False
+    is_added = Store.templates.add(new_template)
+    if not is_added:
+        logging.info("Template exists in database!")
+    return is_added
 
 
 
@@ -236,12 +242,11 @@ def _addTemplate(new_template):
 ### songs helper functions
 def _getSongs():
     """Returns list of songs"""
-    with open(DATA_FILE, "r") as read_file:
-        return json.load(read_file)["songs"]
+    return Store.songs.all()
     
 
 def _songMessage(song):
-    """Returns two strings based on the 'song' <dict>, the first is the main bit, 
+    """Returns two strings based on the 'song' <h_store.Song>, the first is the main bit, 
     and the second is the notes to be posted afterwards"""
     '''
     intro = "***Hello everybody and WELCOME to Stryper Saturday!!!***" 
@@ -250,99 +255,74 @@ def _songMessage(song):
     notes = song["notes"]
     return (intro + description + link), notes
     '''
-    if type(song["notes"]) != str:
-        song["notes"] = " ".join(song["notes"]) #concatenate, otherwise a list of the notes will be inserted into template
-
     template = _randomTemplate()
     body = _insertSongToTemplate(template, song)
-    notes = song["notes"]
 
-    return body, notes
+    return body, song.notes
     
 
-
-
-def _doesSongExist(songs_list, song_url):
-    """Returns (bool, int). 
-    Bool for the existence of song in database, and int of index of existing song.
-    If song doesn't exist, then index is 0. Based on 'song_url' (str)"""
-    print(f"in _doesSongExist(), song_url: {song_url} ")
-    for i, s in enumerate(songs_list):
-        if (song_url == s["url"]):
-            logging.info("Song exists in database!")
-            return True, i
-    return False, 0
-
    
 def _addSong(title, url, rating, notes):
-    """Returns True if successful in adding the song to database or overwriting if""" ##################################finish
-    new_song = {"title":title, "url":url, "rating":rating, "notes":notes}
-    logging.debug("in addSong(), url: %s", new_song['url'])
+    """Returns True if successful in adding the song to database, False if it already exists"""
+    new_song = h_store.Song.fromDict({"title":title, "url":url, "rating":rating, "notes":notes})
+    logging.debug("in addSong(), url: %s", new_song.url)
 
-    current_data_file = _getData()
-    current_songs_list = current_data_file["songs"]
-
-    song_already_exists, index_of_song = _doesSongExist(current_songs_list, new_song["url"])
-    if not song_already_exists:
-        current_songs_list.append(new_song) #add song to database
-        _writeData(current_data_file)
-        return True
-    else:
-        return False
+    is_added = Store.songs.add(new_song)
+    if not is_added:
+        logging.info("Song exists in database!")
+    return is_added
 
 
 def _updateSong(song_url, new_rating, new_notes):
     """Updates song rating and notes in database if it exists. Returns bool of success/failure, messsage str"""    
-    current_data_file = _getData()
-    current_songs_list = current_data_file["songs"]
-
-    song_already_exists, index_of_song = _doesSongExist(current_songs_list, song_url)
-
-    if song_already_exists:
-        rating_is_legit = h_functions._validateRating(new_rating)
+    if song_url in Store.songs:
+        rating_is_legit, _ = h_functions._validateRating(new_rating)
         if rating_is_legit:
             #update song entry    
-            current_songs_list[index_of_song]["rating"] = new_rating
-            current_songs_list[index_of_song]["notes"] = new_notes
-
-            _writeData(current_data_file)
-            #with open(DATA_FILE, "w") as write_file:
-                #json.dump(current_data_file, write_file, indent=JSON_INDENTS)
+            Store.songs.update(song_url, new_rating, new_notes)
             return True, "success"
         return False, "invalid rating"
     return False, "doesn't exist"
 
 
 def _getSong(index):
-    """Returns a song dict of the given index in database"""
-    songs_list = _getSongs()
-    return songs_list[index]
+    """Returns the h_store.Song of the given index in database"""
+    return Store.songs.get(index)
 
 
 def _getRandomSong():
-    "Returns a song dict"
-    songs_list = _getSongs()
-    song_dict = rand.choice(songs_list)
-    return song_dict
+    "Returns a h_store.Song, picked according to RANDOM_MODE"
+    if RANDOM_MODE == "rotation":
+        song = Store.songs.nextInRotation()
+        Store.saveRotation() #so the rotation carries on where it was after a restart
+        return song
+    if RANDOM_MODE == "weighted":
+        return Store.songs.weightedRandom(RATING_WEIGHT_EXPONENT)
+    return Store.songs.random()
+
+def _songLine(index):
+    """Returns str of the song of 'index' for listing, with its index (for .remove_s)"""
+    song = Store.songs.get(index)
+    return f"{index}: {song.title}, {song.url}, {song.rating}/10, {song.notes}"
+
 
 def _strSong(song, suppress_link=True):
     """Returns a nice string of the song"""
-    link_str = (suppress_link * '<') + song['url'] + (suppress_link * '>')
-    return f"{song['title']} ({link_str}) with rating {song['rating']}/10, {song['notes']}"
+    link_str = (suppress_link * '<') + song.url + (suppress_link * '>')
+    return f"{song.title} ({link_str}) with rating {song.rating}/10, {song.notes}"
 
 
 ### both song and template helper functions
 def _remove(key, raw_index):
     """Removes the item of index from database[key], and returns a msg string"""
-    data = _getData()
-    num_items = len(data[key])
+    sub_store = Store.songs if key == "songs" else Store.templates
+    num_items = len(sub_store)
     index = None
     if raw_index.isdigit(): #doesn't accept negative indices
         index = int(raw_index)
 
         if index < num_items:
-            removed_item = data[key].pop(index)
-            _writeData(data)
+            removed_item = sub_store.remove(index)
             if key == "songs":
                 str_item = _strSong(removed_item)
             elif key == "templates":
@@ -361,8 +341,18 @@ async def isMemberPrivileged(Context):
     return ctx_message.author.name in PRIVILEGED_MEMBERS
 
 
+async def isDatabaseLoaded(Context):
+    """Returns bool, and tells 'Context' the database isn't loaded if it isn't, so it can't be changed"""
+    if Store.is_loaded:
+        return True
+    msg = "ERROR: the database isn't loaded (see the log), so it can't be changed"
+    await Context.send(msg)
+    logging.info(msg)
+    return False
+
+
 async def postSong(Context, song):
-    """Uses the 'song' (dict) to make prettier text to post to 'Context'"""
+    """Uses the 'song' (h_store.Song) to make prettier text to post to 'Context'"""
     msg, note = _songMessage(song)
     await Context.send(msg)
     if note != "": await CHANNEL.send(note)
@@ -377,6 +367,7 @@ async def addSong(Context, title, url, rating, raw_notes):
         
     is_success = _addSong(title, url, rating, notes)
     if is_success:
+        await Store.commit() #safely on disk before saying it's added
         await postSong(Context, _getSong(-1))
         logging.info("Adding song to database successful")
         return True
@@ -396,118 +387,26 @@ async def trigger(channel):
         
         logging.info("Triggered")
 
-        #"""
-        #get messages from today
-        year = DateNow.year
-        month = DateNow.month
-        day = DateNow.day
-        tzinfo = TIMEZONE
-        AfterDate = datetime.datetime(year=year, month=month, day=day, tzinfo=tzinfo)
-
-        Msg_Iter = channel.history(after=AfterDate, oldest_first=False)
-    
-        enacted_bit_map = []
-
-        msg_clumps = {}
-
-        prev_author = ""
-
-        i = 0
-        async for Msg in Msg_Iter:
-            if Msg.author == Bot.user:
-                logging.debug("...skipping self...")
-            else:
-                #is SS enacted for Msg??
-                logging.debug("\ti: %s, author: %s  | content: %s", i, Msg.author, Msg.content)
-                yt_video_template_str = "https://www.youtube.com/watch?v="
-                yt_video_id_len = 11 #may change in future depending on YouTube's system; not likely though :D
-
-                            
-                is_stryper_mentioned = "stryper saturday" in Msg.content.lower() 
-                has_rating = "rating" in Msg.content.lower()
-                yt_link_present = yt_video_template_str in Msg.content
-
-                if yt_link_present:
-                    #grab
-                    slice_start = Msg.content.find(yt_video_template_str)
-                    slice_end = slice_start + len(yt_video_template_str) + yt_video_id_len
-                    yt_url = Msg.content[slice_start:slice_end]
-
-                    logging.debug("\tstart: %s, end: %s, url: %s", slice_start, slice_end, yt_url)
-
-                    is_valid_yt, _yt_title, _clean_url = h_functions._validateYoutubeURL(yt_url)
-
-                    logging.debug("\tUrl validation: %s, title: %s, clean: %s", is_valid_yt, _yt_title, _clean_url)
-
-                else:
-                    is_valid_yt = False
-
-
-                if is_stryper_mentioned or has_rating or is_valid_yt:
-                    # add to list to check through
-                    msg_conditions = [is_stryper_mentioned, has_rating, is_valid_yt] 
-                    logging.debug("prev_author: %s, msg_clumps: %s", prev_author, msg_clumps)
-                    if Msg.author == prev_author:
-                        #make sure there is a list ready, otherwise KeyError
-                        if prev_author not in msg_clumps:
-                            msg_clumps[prev_author] = []
-
-                        logging.info("...adding to existing clump...")
-                        msg_clumps[prev_author].append(msg_conditions) # add to list to keep clump
-                    else:
-                        logging.info("...making new clump...")
-                        msg_clumps[Msg.author] = [msg_conditions] # make a new clump
-
-                    #msg_conditions_list.append(msg_conditions)
-            prev_author = Msg.author
-            i += 1
-
-        logging.info("\nProcessing clumbs...")
-        #go through each clump
-        enactors = {}
-        for author, msg_properties_list in msg_clumps.items():
-            logging.debug("author: %s, msg_properties_list: \n%s", author, h_functions._str2DList(msg_properties_list))
-            #msg_properties_list is a 2D list
-            col_bitwise_or_results = []
-            #bit-wise OR each column together
-            num_cols = len(msg_properties_list[0])
-            num_rows = len(msg_properties_list)
-
-            for col in range(num_cols):
-                col_bit_list = []
-                for row in range(num_rows):
-                    col_bit_list.append(msg_properties_list[row][col])
-
-                OR_result = any(col_bit_list) 
-                col_bitwise_or_results.append(OR_result)
-
-                logging.debug("col:%s, col_bit_list: %s, OR_result: %s", col, col_bit_list, OR_result)
-
-
-            stryper_saturday_enacted = all(col_bitwise_or_results)
-            logging.info("col_bitwise_or_results: %s, stryper_saturday_enacted: %s", col_bitwise_or_results, stryper_saturday_enacted)
-
-            if stryper_saturday_enacted:
-                if author not in enactors: #add blank entry
-                    enactors[author] = 0
-                
-                enactors[author] += 1
+        #messages are followed as they come in (on_message), so this is only a catch up after downtime
+        if not ENACTMENT_IS_LIVE:
+            logging.info("Not following the channel live, catching up on today's messages...")
+            _requestCatchUp()
+        await ENACTMENT_QUEUE.join() #any messages still being looked at
 
+        enactors = Tracker.enactorsOn(datetime.datetime.now(TIMEZONE).date())
         logging.info("enactors: %s", enactors)
 
         #respone
-        num_enactors = len(enactors.keys())
-        if num_enactors > 1:
-            msg = "Looks like Stryper central today, as my alogrithm is telling me *more than one* person is enacting Stryper Saturday!!!"
-
-        elif num_enactors != 0:
-            if DAVE_MODE:
-                User = list(enactors.keys())[0]
-                msg = f"{User.mention} grrrrrrrr"
+        num_enactors = len(enactors)
+        if num_enactors != 0:
+            if num_enactors > 1:
+                msg = "Looks like Stryper central today, as my alogrithm is telling me *more than one* person is enacting Stryper Saturday!!!"
+            elif DAVE_MODE:
+                author_id = next(iter(enactors))
+                msg = f"<@{author_id}> grrrrrrrr"
             else:
                 msg = "**Rock on!**"
 
-
             await channel.send(msg)
             logging.info(msg)
         else:
@@ -515,19 +414,6 @@ async def trigger(channel):
             song = _getRandomSong()
             await postSong(channel, song)
 
-        '''
-        already_enacted = True in enacted_bit_map
-
-        if not already_enacted:
-            pass #enact
-        else:
-            pass #reply with a 'oo-rah!!!' kinda of message??? (REPLY @ ENACT-TOR)
-        '''
-
-
-
-        
-        #"""
     else:
         day_str = h_functions._getDictKey(DAYS_LEGEND, day_num) 
         msg = f"Wrong day to trigger as today is {day_str} not {TRIGGER_DAY_STR} \n:("
@@ -537,6 +423,77 @@ async def trigger(channel):
 
 
 
+### Enactment tracking helper functions
+def _requestCatchUp():
+    """Queues a look through today's messages the Bot hasn't seen yet, after any messages already queued"""
+    ENACTMENT_QUEUE.put_nowait(None)
+
+
+async def _catchUp(channel):
+    """Feeds Tracker every message of today it hasn't been fed yet, e.g. ones posted while the Bot was down,
+    then the ones held back meanwhile, and goes live. Messages newer than the missed ones mustn't be fed
+    first, as Tracker skips anything older than the last message it was fed"""
+    global ENACTMENT_IS_LIVE, ENACTMENT_HELD, ENACTMENT_HELD_DROPPED
+    while True:
+        ENACTMENT_HELD_DROPPED = False
+        today = datetime.datetime.now(TIMEZONE).date()
+        After = datetime.datetime(year=today.year, month=today.month, day=today.day, tzinfo=TIMEZONE)
+        if Tracker.isCurrent(today) and Tracker.last_id:
+            After = discord.Object(id=Tracker.last_id)
+
+        messages = [Msg async for Msg in channel.history(limit=None, after=After, oldest_first=True)]
+        logging.info("Catching up on %s messages", len(messages))
+        await _feedMessages(messages)
+        while ENACTMENT_HELD and not ENACTMENT_HELD_DROPPED: #more can come in while these are validated
+            held, ENACTMENT_HELD = sorted(ENACTMENT_HELD, key=lambda Msg: Msg.id), []
+            await _feedMessages(held)
+        if not ENACTMENT_HELD_DROPPED:
+            break
+        logging.info("Held messages were dropped while catching up, reading history again")
+    ENACTMENT_IS_LIVE = True #no await since the last check, so nothing is left held
+
+
+async def _feedMessages(messages):
+    """Feeds Tracker 'messages' (list of discord.Message, oldest first). Their youtube links are grabbed
+    first, so they can all be validated at once instead of one message at a time"""
+    yt_urls = [] #(message index, url), a message can have several links
+    for i, Msg in enumerate(messages):
+        if Msg.author != Bot.user and Msg.id > Tracker.last_id:
+            for video_id in h_functions._findVideoIDs(Msg.content):
+                yt_urls.append((i, h_functions._videoURL(video_id)))
+
+    url_results = await h_functions._validateMany([url for _, url in yt_urls])
+    valid_yt_msgs = {} #message index: bool, True if any of its links is an official Stryper video
+    for (i, url), (is_valid_yt, _yt_title, _clean_url) in zip(yt_urls, url_results):
+        logging.debug("\ti: %s, url: %s, validation: %s, title: %s", i, url, is_valid_yt, _yt_title)
+        valid_yt_msgs[i] = valid_yt_msgs.get(i, False) or is_valid_yt
+
+    for i, Msg in enumerate(messages):
+        date = Msg.created_at.astimezone(TIMEZONE).date()
+        if Msg.author == Bot.user:
+            Tracker.feed(Msg.id, date, None, 0) #still ends the clump
+        else:
+            mask = h_enactment._messageMask(Msg.content, valid_yt_msgs.get(i, False))
+            logging.debug("\tauthor: %s, mask: %s | content: %s", Msg.author, mask, Msg.content)
+            Tracker.feed(Msg.id, date, str(Msg.author.id), mask)
+
+
+async def _trackEnactments():
+    """Feeds Tracker the channel's messages from ENACTMENT_QUEUE one at a time, so in the order they came"""
+    while True:
+        item = await ENACTMENT_QUEUE.get()
+        try:
+            if item is None:
+                await _catchUp(CHANNEL)
+            else:
+                await _feedMessages([item])
+        except Exception:
+            logging.exception("Tracking enactments failed")
+        finally:
+            ENACTMENT_QUEUE.task_done()
+
+
+
 ### 'slash' commands (prefix defined in Bot constructor)
 @Bot.command()
 async def alive(Context):
@@ -547,6 +504,19 @@ async def alive(Context):
 
 
 
+@Bot.command()
+async def stats(Context):
+    """Posts the youtube validation counters (cache hits/misses, fetches saved by sharing)"""
+    is_member_privileged = await isMemberPrivileged(Context) 
+    if is_member_privileged:
+        msg = "Validation stats:"
+        for name, counters in h_functions._validationStats().items():
+            msg += f"\n\t{name}: " + ", ".join(f"{k} {v}" for k, v in counters.items())
+        await Context.send(msg)
+        logging.info(msg)
+
+
+
 ## song slash commands
 @Bot.command()
 async def random(Context):
@@ -564,11 +534,11 @@ async def add_s(Context, youtube_url, rating, *raw_notes):
     and 'raw_notes' is just in case someone adds song notes without quotes, as discord.py
     seems to split arguements by spaces."""
     is_member_privileged = await isMemberPrivileged(Context) 
-    if is_member_privileged:
+    if is_member_privileged and await isDatabaseLoaded(Context):
         logging.info("User inputted: '%s', '%s', and '%s'", youtube_url, rating, raw_notes)
 
         #validate user input
-        url_is_legit, yt_title_or_error, clean_yt_url = h_functions._validateYoutubeURL(youtube_url)
+        url_is_legit, yt_title_or_error, clean_yt_url = await h_functions._validateYoutubeURLAsync(youtube_url)
         rating_is_legit, rating_error_msg = h_functions._validateRating(rating)
         
         #output stuff
@@ -596,13 +566,14 @@ async def add_s(Context, youtube_url, rating, *raw_notes):
 async def update(Context, song_url, new_rating, *new_notes):
     """Updates database provided the song_url is in the database"""
     is_member_privileged = await isMemberPrivileged(Context) 
-    if is_member_privileged:
-        url_is_legit, _, clean_url = h_functions._validateYoutubeURL(song_url)
+    if is_member_privileged and await isDatabaseLoaded(Context):
+        url_is_legit, _, clean_url = await h_functions._validateYoutubeURLAsync(song_url)
 
         if url_is_legit:
             is_successful, status_msg = _updateSong(clean_url, new_rating, new_notes)
 
             if is_successful:
+                await Store.commit()
                 msg = status_msg
             else:
                 msg = f"ERROR: {status_msg}"  
@@ -619,8 +590,9 @@ async def update(Context, song_url, new_rating, *new_notes):
 async def remove_s(Context, raw_index):
     """Remove a song from database"""
     is_member_privileged = await isMemberPrivileged(Context) 
-    if is_member_privileged:
+    if is_member_privileged and await isDatabaseLoaded(Context):
         msg = _remove("songs", raw_index)
+        await Store.commit()
         logging.info(msg)
         await Context.send(msg)
 
@@ -631,18 +603,30 @@ async def songs(Context):
     is_member_privileged = await isMemberPrivileged(Context) 
     if is_member_privileged:
         logging.info("printing song database...")
-        msg = "Song database: \n"
+        Pages = h_pages.PagedList("Song database", lambda: len(Store.songs), _songLine, author_id=Context.author.id)
+        Pages.Message = await Context.send(embed=Pages.render(), view=Pages)
 
-        for i, song in enumerate(_getSongs()):
-            raw_notes = song["notes"]
-            if type(raw_notes) != str:
-                notes = " ".join(song["notes"])
-            else:
-                notes = raw_notes
-            msg += f"\t{i}: {song['title']}, <{song['url']}>, {song['rating']}/10, {notes} \n"
 
-        await Context.send(msg)
-        logging.info(msg)
+@Bot.command()
+async def search(Context, *raw_terms):
+    """Prints the songs best matching the terms, from their titles and notes. A term ending in '*'
+    matches the start of words, and 'rating>=7' (or <, <=, >, =) filters by rating"""
+    is_member_privileged = await isMemberPrivileged(Context) 
+    if is_member_privileged:
+        query = " ".join(raw_terms)
+        found_songs, num_matches = Store.songs.search(query, SEARCH_MAX_RESULTS)
+
+        logging.info("search '%s': %s matches", query, num_matches)
+
+        if num_matches == 0:
+            await Context.send(h_pages._shorten(f"No songs match '{query}'"))
+        else:
+            title = f"{num_matches} songs match '{query}'"
+            if num_matches > len(found_songs):
+                title += f", the best {len(found_songs)}"
+            line = lambda i: f"{found_songs[i].title}, {found_songs[i].url}, {found_songs[i].rating}/10, {found_songs[i].notes}"
+            Pages = h_pages.PagedList(title, lambda: len(found_songs), line, author_id=Context.author.id)
+            Pages.Message = await Context.send(embed=Pages.render(), view=Pages)
 
 
 
@@ -651,14 +635,15 @@ async def songs(Context):
 async def add_t(Context, *raw_new_template_parts):
     """Add a template string to database"""
     is_member_privileged = await isMemberPrivileged(Context) 
-    if is_member_privileged:
+    if is_member_privileged and await isDatabaseLoaded(Context):
         #print(raw_new_template_parts)
         new_template = " ".join(raw_new_template_parts)
-        is_valid, code_bools = _isValidTemplate(new_template)
+        is_valid, code_bools, unknown_codes = _isValidTemplate(new_template)
 
         if is_valid:
             is_successful = _addTemplate(new_template)
             if is_successful:
+                await Store.commit()
                 msg = "Success"
             else:
                 msg = "Template already exists!"     
@@ -672,6 +657,8 @@ async def add_t(Context, *raw_new_template_parts):
                 msg += "\n\tRequires rating code '{rating}'"
             if not code_bools[2]:
                 msg += "\n\tRequires url code '{url}'"
+            for code in unknown_codes:
+                msg += f"\n\tUnknown code '{{{code}}}', the codes are " + ", ".join("{" + field + "}" for field in h_template.FIELDS)
             
         await Context.send(msg)
         logging.info(msg)
@@ -681,8 +668,9 @@ async def add_t(Context, *raw_new_template_parts):
 async def remove_t(Context, raw_index):
     """Remove a template string from database"""
     is_member_privileged = await isMemberPrivileged(Context) 
-    if is_member_privileged:
+    if is_member_privileged and await isDatabaseLoaded(Context):
         msg = _remove("templates", raw_index)
+        await Store.commit()
         logging.info(msg)
         await Context.send(msg)
 
@@ -693,17 +681,40 @@ async def templates(Context):
     is_member_privileged = await isMemberPrivileged(Context) 
     if is_member_privileged:
         logging.info("printing template database...")
-        msg = "Template database: \n"
+        Pages = h_pages.PagedList("Template database", lambda: len(Store.templates), _templateLine, author_id=Context.author.id)
+        Pages.Message = await Context.send(embed=Pages.render(), view=Pages)
 
-        for i, template in enumerate(_getTemplates()):
-            msg += f"\t{i}: {template} \n"
 
-        await Context.send(msg)
-        logging.info(msg)
 
+###event commands
+@Bot.listen()
+async def on_message(Msg):
+    """Queues every message of the channel for Tracker (or holds it until a catch up has been, if not 
+    following the channel live), commands are still handled as usual"""
+    global ENACTMENT_HELD_DROPPED
+    if CHANNEL is not None and Msg.channel.id == CHANNEL.id:
+        if ENACTMENT_IS_LIVE:
+            ENACTMENT_QUEUE.put_nowait(Msg)
+        elif len(ENACTMENT_HELD) < ENACTMENT_HELD_MAX:
+            ENACTMENT_HELD.append(Msg)
+        else:
+            ENACTMENT_HELD.clear() #they are all newer than Tracker.last_id, so the catch up reads them from history
+            ENACTMENT_HELD_DROPPED = True
+
+
+@Bot.listen()
+async def on_disconnect():
+    global ENACTMENT_IS_LIVE
+    ENACTMENT_IS_LIVE = False #messages can be missed until a catch up, anything newer is held until then
+
+
+@Bot.listen()
+async def on_resumed():
+    """A resumed session doesn't get on_ready, so catch up (and go live again) here"""
+    if ENACTMENT_QUEUE is not None:
+        _requestCatchUp()
 
 
-###event commands
 @Bot.event
 async def on_ready():
     """Runs when Bot is ready, kind of like a class constructor/init/"""
@@ -713,17 +724,46 @@ async def on_ready():
 
     _loadPrivilegedMembers()
 
-    data_already_exists = _doesDataFileExist()
+    await h_functions._openSession() #shared youtube http session, closed in StryperBot.close()
+
+    data_already_exists = await Store.persister.run(_doesDataFileExist) #file I/O stays on the data I/O thread
+    if not Store.is_loaded: #on_ready can run again after reconnecting, memory is already up to date
+        try:
+            await Store.loadAsync()
+        except Exception:
+            logging.exception("Loading '%s' failed", Store.path)
+        if DATA_WATCH and Store.is_loaded:
+            Store.watch()
 
     logging.info(f"{Bot.user} has connected to Discord, into '{CHANNEL}' channel!")
     await CHANNEL.send(TRIGGER_SETUP_MSG)
     logging.info(TRIGGER_SETUP_MSG)
 
+    if not Store.is_loaded:
+        msg = "ERROR: couldn't load the database (see the log), it can't be changed until it is fixed and I'm restarted"
+        await CHANNEL.send(msg)
+        logging.info(msg)
+
     if not data_already_exists:
         msg = "ERROR: database is empty, please fill..."
         await CHANNEL.send(msg)
         logging.debug(msg)
 
+    #follow the channel's messages from here on, after catching up on the ones missed
+    global ENACTMENT_QUEUE, ENACTMENT_TASK
+    if not Tracker.is_loaded:
+        await Tracker.loadAsync()
+    if ENACTMENT_TASK is None or ENACTMENT_TASK.done():
+        ENACTMENT_QUEUE = asyncio.Queue()
+        ENACTMENT_TASK = asyncio.create_task(_trackEnactments())
+    _requestCatchUp()
+
+    #low priority background task, on_ready carries on straight away
+    global PREWARM_TASK
+    if PREWARM_TASK is None or PREWARM_TASK.done(): #on_ready can run again after reconnecting
+        song_urls = [song.url for song in _getSongs()]
+        PREWARM_TASK = asyncio.create_task(h_functions._prewarmCache(song_urls))
+
     #loop functions
     await trigger.start(CHANNEL)
 